@@ -2,7 +2,7 @@ from django.contrib import admin
 
 from .models import (
     Color, Part, PartCategory, PartRelationship,
-    PartExternalId, SetPart, UserPart, Inventory
+    PartExternalId, SetPart, UserPart, Inventory, ImportFileState
 )
 
 
@@ -37,11 +37,10 @@ class PartAdmin(admin.ModelAdmin):
     readonly_fields = ['related_parts', 'available_colors', 'set_inventories', 'set_count']
 
     def related_parts(self, obj):  # pylint:disable=no-self-use
-        return ', '.join(p.part_num for p in obj.get_related_parts(
-            parents=True, children=True, transitive=True))
+        return ', '.join(obj.family_members.exclude(pk=obj.pk).values_list('part_num', flat=True))
 
     def related_part_count(self, obj):  # pylint:disable=no-self-use
-        return F'{obj.related_part_count(parents=True, children=True, transitive=True)}'
+        return F'{obj.family_members.exclude(pk=obj.pk).count()}'
 
     def available_colors(self, obj):  # pylint:disable=no-self-use
         return ', '.join(c.name for c in obj.available_colors.order_by('name'))
@@ -77,6 +76,10 @@ class InventoryAdmin(admin.ModelAdmin):
     list_display = ('userpart', 'color', 'qty')
 
 
+class ImportFileStateAdmin(admin.ModelAdmin):
+    list_display = ('source', 'name', 'row_count', 'imported', 'content_hash')
+
+
 # Register your models here.
 admin.site.register(Color, ColorAdmin)
 admin.site.register(Part, PartAdmin)
@@ -86,3 +89,4 @@ admin.site.register(PartRelationship, PartRelationshipAdmin)
 admin.site.register(PartExternalId, PartExternalIdpAdmin)
 admin.site.register(UserPart, UserPartAdmin)
 admin.site.register(Inventory, InventoryAdmin)
+admin.site.register(ImportFileState, ImportFileStateAdmin)
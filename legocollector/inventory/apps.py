@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class InventoryConfig(AppConfig):
     name = 'inventory'
+
+    def ready(self):
+        # Connects the PartRelationship signal handlers
+        from inventory import part_families  # pylint: disable=import-outside-toplevel,unused-import
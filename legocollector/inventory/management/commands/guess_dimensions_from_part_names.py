@@ -1,70 +1,66 @@
 import logging
-import re
 
-from decimal import Decimal
+from collections import defaultdict
 
 from django.db import transaction
-from django.core.management.base import BaseCommand
-from inventory.models import Part
+from inventory.management.telemetry import ReportCommand
+from inventory.models import Part, PartCategory
+from utils import part_dimensions
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+BULK_BATCH_SIZE = 999  # Max for Sqlite3
 
-class Command(BaseCommand):
 
-    def handle(self, *args, **options):
-        self.guess_dimensions()
-
-    def guess_dimensions(self):
-        logger.info('Guess Dimensions')
-        part_list = Part.objects.all()
-        part_updates = 0
-        with transaction.atomic():
-            for part in part_list:
-                if part.dimension_set_count == 0:
-                    guessed_dims = self.guess_dimension_from_name(part.name)
-                    if guessed_dims:
-                        part.width = guessed_dims[0]
-                        part.length = guessed_dims[1]
-                        part.height = guessed_dims[2]
-                        part.save()
-
-                        part_updates += 1
+class Command(ReportCommand):
 
-                        if part_updates and (part_updates % 1000) == 0:
-                            logger.info(F'  Parts Updated: {part_updates}')
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes to match part names with, 1 matches in this process')
 
-        logger.info(F'Total Dimensions Updated: {part_updates}')
+    def handle(self, *args, **options):
+        with self.report.stage('guess_dimensions') as stage_stats:
+            stage_stats.update(self.guess_dimensions(workers=options['workers']))
 
-    @staticmethod
-    def guess_dimension_from_name(name):
-        dim_tup = None
-        pattern_2 = '(?P<wh1>[0-9]{1,}) *?x *?(?P<wh2>[0-9]{1,})'
-        pattern_3 = '(?P<wh1>[0-9]{1,}) *?x *?(?P<wh2>[0-9]{1,}) *?x *?(?P<height>[0-9]{1,})'
+    def guess_dimensions(self, *, workers=1):
+        logger.info('Guess Dimensions')
+        import_stats = defaultdict(int)
+        categories = PartCategory.objects.in_bulk()
 
-        width = length = height = None
+        # Only parts without any dimension are candidates
+        candidates = Part.objects.filter(
+            width__isnull=True, length__isnull=True, height__isnull=True).values_list('id', 'name', 'category_id')
 
-        # Check if 2 Dimensions Found
-        result = re.search(pattern_3, name)
+        def part_names():
+            for part_id, name, category_id in candidates.iterator():
+                import_stats['read'] += 1
+                yield ((part_id, category_id), name)
 
-        if result:
-            height = Decimal(result.group('height'))
+        if workers > 1:
+            guessed = part_dimensions.guess_dimensions_parallel(part_names(), workers=workers)
         else:
+            guessed = part_dimensions.guess_dimensions(part_names())
 
-            # Check if 2 Dimensions Found
-            result = re.search(pattern_2, name)
+        changed_parts = []
+        with transaction.atomic():
+            for (part_id, category_id), (width, length, height) in guessed:
+                part = Part(id=part_id, category=categories[category_id], width=width, length=length, height=height,
+                            attributes_dirty=True)
+                # bulk_update doesn't call save()
+                part.normalize_dimensions()
+                changed_parts.append(part)
 
-        if result:
-            cand_w = Decimal(result.group('wh1'))
-            cand_h = Decimal(result.group('wh2'))
+                if (len(changed_parts) % 1000) == 0:
+                    logger.info(F'  Parts Updated: {len(changed_parts)}')
 
-            if cand_w > cand_h:
-                length = cand_w
-                width = cand_h
-            else:
-                length = cand_h
-                width = cand_w
+            Part.objects.bulk_update(
+                changed_parts, ['width', 'length', 'height', 'attributes_dirty'], batch_size=BULK_BATCH_SIZE)
 
-            dim_tup = (width, length, height)
+        logger.info(F'Total Dimensions Updated: {len(changed_parts)}')
+        import_stats['updated'] = len(changed_parts)
+        import_stats['skipped'] = import_stats['read'] - len(changed_parts)
+        return import_stats
 
-        return dim_tup
+    @staticmethod
+    def guess_dimension_from_name(name):
+        return part_dimensions.guess_dimension_from_name(name)
@@ -1,71 +1,121 @@
 import logging
 
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
 from defusedxml import ElementTree as ET
 
 from django.db import transaction
-from django.core.management.base import BaseCommand
+from inventory.management.telemetry import ReportCommand
 from inventory.models import Part, PartExternalId
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+BULK_BATCH_SIZE = 999  # Max for Sqlite3
+
 
-class Command(BaseCommand):
+class Command(ReportCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('parts_xml_path', type=str)
 
-    def handle(self, *args, **options):  # pylint: disable=too-many-locals,too-many-branches
-        parts_xml_path = options['parts_xml_path']
-
+    def handle(self, *args, **options):
+        with self.report.stage('bricklink_attributes') as stage_stats:
+            stage_stats.update(self.import_attributes(options['parts_xml_path']))
+
+    @staticmethod
+    def iter_items(parts_xml_path):
+        # Stream the ITEM elements, each one is removed from the tree once processed so memory stays flat
+        root = None
+        for event, element in ET.iterparse(parts_xml_path, events=('start', 'end')):
+            if root is None:
+                root = element
+            elif (event == 'end') and (element.tag == 'ITEM'):
+                yield element
+                root.clear()
+
+    @staticmethod
+    def import_attributes(parts_xml_path):
         logger.info('Importing Part Attributes')
-        # parse the xml file
-        tree = ET.parse(parts_xml_path)
-        root = tree.getroot()
+        import_stats = defaultdict(int)
+
+        # Allow for different bricklink IDs to point to the same part, part_nums are the backup
+        bricklink_part_ids = defaultdict(list)
+        for external_id, part_id in PartExternalId.objects.filter(
+                provider=PartExternalId.BRICKLINK).values_list('external_id', 'part_id'):
+            bricklink_part_ids[external_id].append(part_id)
+        part_num_ids = dict(Part.objects.values_list('part_num', 'id'))
+
+        item_dimensions = {}
+        for idx, item_tag in enumerate(Command.iter_items(parts_xml_path)):
+            import_stats['read'] += 1
+            item_id = item_tag.find('ITEMID').text
+            dimensions = [parse_dimension(item_tag.find(tag).text) for tag in ('ITEMDIMX', 'ITEMDIMY', 'ITEMDIMZ')]
+
+            if item_id and any(dim is not None for dim in dimensions):
+                if item_id in bricklink_part_ids:
+                    part_ids = bricklink_part_ids[item_id]
+                elif item_id in part_num_ids:
+                    part_ids = [part_num_ids[item_id]]
+                else:
+                    part_ids = []
 
-        attributes_set_count = 0
+                for part_id in part_ids:
+                    item_dimensions[part_id] = dimensions
+            else:
+                logger.debug(F'  Invalid item Id Found: "{item_id}"')
+                import_stats['skipped'] += 1
 
-        bricklink_external_ids = [
-            e.external_id for e in PartExternalId.objects.filter(provider=PartExternalId.BRICKLINK)]
+            if (idx % 1000) == 0:
+                logger.info(F'  Items Processed: {idx}')
 
-        with transaction.atomic():
-            for idx, item_tag in enumerate(root.findall('ITEM')):  # pylint: disable=too-many-nested-blocks
-                item_id = item_tag.find('ITEMID').text
-                item_x = item_tag.find('ITEMDIMX').text
-                item_y = item_tag.find('ITEMDIMY').text
-                item_z = item_tag.find('ITEMDIMZ').text
-
-                if item_id and any([item_x, item_y, item_z]):
-                    part_list = []
-
-                    # First check for Bricklink ID and part_nums as backup
-                    if item_id in bricklink_external_ids:
-                        # Allow for different bricklink IDs to point to the same part
-                        part_list = [e.part for e in PartExternalId.objects.filter(
-                            provider=PartExternalId.BRICKLINK, external_id=item_id)]
-                    else:
-                        part = Part.objects.filter(part_num=item_id).first()
-                        if part:
-                            part_list.append(part)
-
-                    # Update related parts
-                    for part in part_list:
-                        if item_x and item_y and (item_y > item_x):
-                            part.length = item_y
-                            part.width = item_x
-                        else:
-                            part.length = item_x
-                            part.width = item_y
-                        part.height = item_z
-                        part.save()
-
-                        attributes_set_count += 1
-
-                        if (attributes_set_count % 1000) == 0:
-                            logger.info(F'   Attributes Set on: {attributes_set_count} parts')
-                else:
-                    logger.debug(F'  Invalid item Id Found: "{item_id}"')
+        logger.info(F'  Attributes found for: {len(item_dimensions)} parts')
+        import_stats['updated'] = Command._update_dimensions(item_dimensions)
+        import_stats['skipped'] += len(item_dimensions) - import_stats['updated']
+
+        logger.info(F'  Total Attributes Set on: {import_stats["updated"]} parts')
+        return import_stats
 
-                if (idx % 1000) == 0:
-                    logger.info(F'  Items Processed: {idx}')
+    @staticmethod
+    def _update_dimensions(item_dimensions):
+        # Only write the parts where the normalized dimensions actually change
+        dimension_fields = ['width', 'length', 'height']
+        part_ids = list(item_dimensions)
+        updated_count = 0
 
-        logger.info(F'  Total Attributes Set on: {attributes_set_count} parts')
+        with transaction.atomic():
+            for idx in range(0, len(part_ids), BULK_BATCH_SIZE):
+                changed_parts = []
+                parts = Part.objects.select_related('category').in_bulk(part_ids[idx:idx + BULK_BATCH_SIZE])
+                for part_id, part in parts.items():
+                    item_x, item_y, item_z = item_dimensions[part_id]
+                    old_dimensions = part.stored_dimensions
+
+                    if item_x is not None and item_y is not None and (item_y > item_x):
+                        part.length = item_y
+                        part.width = item_x
+                    else:
+                        part.length = item_x
+                        part.width = item_y
+                    part.height = item_z
+                    part.normalize_dimensions()
+
+                    if part.stored_dimensions != old_dimensions:
+                        part.attributes_dirty = True
+                        changed_parts.append(part)
+
+                Part.objects.bulk_update(
+                    changed_parts, dimension_fields + ['attributes_dirty'], batch_size=BULK_BATCH_SIZE)
+                updated_count += len(changed_parts)
+
+        return updated_count
+
+
+def parse_dimension(value):
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        logger.debug(F'  Invalid dimension Found: "{value}"')
+        return None
@@ -1,16 +1,20 @@
-import json
 import logging
 import os
 
-from django.core.management.base import BaseCommand
+from collections import defaultdict
+
 from django.db import transaction
 
+from inventory.management.telemetry import ReportCommand
 from inventory.models import Part, PartExternalId
+from utils import json_stream
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+BULK_BATCH_SIZE = 999  # Max for Sqlite3
+
 
-class Command(BaseCommand):
+class Command(ReportCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('json_file_path', type=str)
@@ -18,49 +22,61 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         json_file_path = options['json_file_path']
 
-        json_dic = {}
-        if os.path.exists(json_file_path):
-            with open(json_file_path, 'r', encoding='utf-8') as file_ptr:
-                json_dic = json.load(file_ptr)
-        else:
-            logger.error(F'ERROR - Json file "{json_file_path}" does not exist')
-
-        self.import_ldraw_data(json_dic)
+        with self.report.stage('ldraw_studs') as stage_stats:
+            if os.path.exists(json_file_path):
+                with open(json_file_path, 'r', encoding='utf-8') as file_ptr:
+                    stage_stats.update(self.import_ldraw_data(json_stream.iter_object_items(file_ptr)))
+            else:
+                logger.error(F'ERROR - Json file "{json_file_path}" does not exist')
 
     @staticmethod
-    def import_ldraw_data(data_dic):
+    def import_ldraw_data(part_items):
         logger.info('Importing Ldraw Data')
-        parts_processed_counts = 0
-        part_list = Part.objects.values_list('part_num', flat=True)
+        import_stats = defaultdict(int)
+        stud_fields = ['top_studs', 'bottom_studs', 'stud_rings']
 
-        ldraw_external_ids = [
-            e.external_id for e in PartExternalId.objects.filter(provider=PartExternalId.LDRAW)]
+        part_studs = {}
+        part_num_ids = {}
+        for part_id, part_num, *studs in Part.objects.values_list('id', 'part_num', *stud_fields):
+            part_studs[part_id] = tuple(studs)
+            part_num_ids[part_num] = part_id
+
+        # Allow for different ldraw IDs to point to the same part, part_nums are the backup
+        ldraw_part_ids = defaultdict(list)
+        for external_id, part_id in PartExternalId.objects.filter(
+                provider=PartExternalId.LDRAW).values_list('external_id', 'part_id'):
+            ldraw_part_ids[external_id].append(part_id)
 
         parts_not_found_list = []
+        changed_parts = []
+        for part_num, part_dic in part_items:
+            import_stats['read'] += 1
+            if part_num in ldraw_part_ids:
+                part_ids = ldraw_part_ids[part_num]
+            elif part_num in part_num_ids:
+                part_ids = [part_num_ids[part_num]]
+            else:
+                parts_not_found_list.append(part_num)
+                continue
+
+            if "processing_errors" in part_dic:
+                import_stats['skipped'] += 1
+                continue
+
+            studs = (part_dic['top_top_studs'], part_dic['bottom_studs'], part_dic['stud_ring_count'])
+            for part_id in part_ids:
+                if part_studs[part_id] != studs:
+                    changed_parts.append(Part(id=part_id, attributes_dirty=True, **dict(zip(stud_fields, studs))))
+                else:
+                    import_stats['skipped'] += 1
 
         with transaction.atomic():
-            for part_num, part_dic in data_dic.items():  # pylint: disable=too-many-nested-blocks
-                part_list = []
-                if part_num in ldraw_external_ids:
-                    part_list = [e.part for e in PartExternalId.objects.filter(
-                        provider=PartExternalId.LDRAW, external_id=part_num)]
-                else:
-                    part = Part.objects.filter(part_num=part_num).first()
-                    if part:
-                        part_list.append(part)
-                    else:
-                        parts_not_found_list.append(part_num)
-
-                for part in part_list:
-                    if "processing_errors" not in part_dic:
-                        part.top_studs = part_dic['top_top_studs']
-                        part.bottom_studs = part_dic['bottom_studs']
-                        part.stud_rings = part_dic['stud_ring_count']
-                        part.save()
-
-                    parts_processed_counts += 1
-                    if (parts_processed_counts % 1000) == 0:
-                        logger.info(F'  {parts_processed_counts} Parts Processed')
+            for idx in range(0, len(changed_parts), BULK_BATCH_SIZE):
+                Part.objects.bulk_update(changed_parts[idx:idx + BULK_BATCH_SIZE], stud_fields + ['attributes_dirty'])
+                logger.info(F'  {min(idx + BULK_BATCH_SIZE, len(changed_parts))} Parts Updated')
 
         logger.info(F'Parts not Found:\n{sorted(parts_not_found_list)}')
-        logger.info(F'Total of {parts_processed_counts} DB Parts Processed')
+        logger.info(F'Total of {len(changed_parts)} DB Parts Updated')
+        import_stats['updated'] = len(changed_parts)
+        import_stats['skipped'] += len(parts_not_found_list)
+        return import_stats
@@ -1,171 +1,467 @@
 import csv
+import gzip
+import hashlib
+import io
 import logging
 import os
+import time
+import zipfile
 
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from contextlib import ExitStack, contextmanager
 
 from django.db import transaction
-from django.core.management.base import BaseCommand, CommandError
-from inventory.models import Color, PartCategory, Part, PartRelationship, SetPart
+from django.core.management.base import CommandError
+from inventory.management import sql_merge
+from inventory.management.import_diff import DryRunImport
+from inventory.management.telemetry import ReportCommand
+from inventory.models import Color, ImportFileState, PartCategory, Part, PartRelationship, SetPart
+from inventory.part_families import deferred_family_updates, update_part_families
+from utils import rebrickable_csv
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+BULK_BATCH_SIZE = 999  # Max for Sqlite3
+HASH_CHUNK_SIZE = 1024 * 1024
 
-class Command(BaseCommand):
+
+class Command(ReportCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('config_path', type=str)
+        parser.add_argument('--force', action='store_true',
+                            help='Import all files, even if unchanged since the last import')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes to parse inventory_parts with, 1 parses in this process')
+        parser.add_argument('--backend', choices=['orm', 'sql'], default='orm',
+                            help='"sql" merges colors, categories, parts and relationships through staging tables')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Show what the import would change without writing to the database')
 
     def handle(self, *args, **options):
-        import_dir = options['config_path']
-
-        # Supported files to import
-        import_files = OrderedDict()
-
-        import_files[os.path.join(import_dir, 'colors.csv')] = self._populate_colors
-        import_files[os.path.join(import_dir, 'part_categories.csv')] = self._populate_part_categories
-        import_files[os.path.join(import_dir, 'parts.csv')] = self._populate_parts
-        import_files[os.path.join(import_dir, 'part_relationships.csv')] = self._populate_relationships
-        import_files[os.path.join(import_dir, 'inventory_parts.csv')] = self._populate_set_parts
+        import_path = options['config_path']
+
+        # Supported files to import, in import order
+        import_stages = OrderedDict()
+        import_stages['colors'] = self._populate_colors
+        import_stages['part_categories'] = self._populate_part_categories
+        import_stages['parts'] = self._populate_parts
+        import_stages['part_relationships'] = self._populate_relationships
+        import_stages['inventory_parts'] = self._populate_set_parts
+
+        if options['backend'] == 'sql':
+            try:
+                sql_merge.check_backend_supported()
+            except ValueError as error:
+                raise CommandError(F'Cannot use the sql backend: {error}') from error
+
+            import_stages['colors'] = sql_merge.merge_colors
+            import_stages['part_categories'] = sql_merge.merge_part_categories
+            import_stages['parts'] = sql_merge.merge_parts
+            import_stages['part_relationships'] = sql_merge.merge_relationships
 
         try:
-            self._validate_config_path(import_dir, import_files.keys())
+            import_files = self._find_import_files(import_path, import_stages.keys())
         except ValueError as error:
             raise CommandError(F'Failed to validate config path: {error}')
 
+        if options['dry_run']:
+            self._dry_run(import_path, import_files)
+            return
+
         # Process import files
-        for file_path, import_func in import_files.items():
-            with open(file_path, encoding='utf8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                import_func(reader)
+        import_remaining = options['force']
+        for name, import_func in import_stages.items():
+            content_hash = self._hash_import_file(import_path, import_files[name])
+
+            if not import_remaining:
+                last_import = ImportFileState.objects.filter(source=ImportFileState.REBRICKABLE, name=name).first()
+                if last_import and last_import.content_hash == content_hash:
+                    logger.info(F'Skip "{name}", unchanged since last import on {last_import.imported}')
+                    self.report.skip_stage(name, 'unchanged')
+                    continue
+
+            # Later files depend on earlier ones, e.g. new parts can complete previously skipped relationships
+            import_remaining = True
+
+            with self.report.stage(name) as stage_stats, \
+                    self._open_import_file(import_path, import_files[name]) as csvfile:
+                if (name == 'inventory_parts') and (options['workers'] > 1):
+                    import_stats = self._populate_set_parts_pipeline(csvfile, workers=options['workers'])
+                else:
+                    import_stats = import_func(csv.DictReader(csvfile))
+                stage_stats.update(import_stats)
+
+            ImportFileState.objects.update_or_create(
+                source=ImportFileState.REBRICKABLE, name=name,
+                defaults={'content_hash': content_hash, 'row_count': import_stats['read']})
+
+    def _dry_run(self, import_path, import_files):
+        dry_run = DryRunImport()
+
+        diff_stages = OrderedDict()
+        diff_stages['colors'] = dry_run.diff_colors
+        diff_stages['part_categories'] = dry_run.diff_part_categories
+        diff_stages['parts'] = dry_run.diff_parts
+        diff_stages['part_relationships'] = dry_run.diff_relationships
+
+        for name, diff_func in diff_stages.items():
+            with self.report.stage(name) as stage_stats, \
+                    self._open_import_file(import_path, import_files[name]) as csvfile:
+                diff = diff_func(csv.DictReader(csvfile))
+                stage_stats.update(diff.import_stats)
+            diff.log()
+
+        # Set Parts are compared in partitions, the file is opened once per partition
+        with self.report.stage('inventory_parts') as stage_stats:
+            diff = dry_run.diff_set_parts(
+                lambda: self._open_import_file(import_path, import_files['inventory_parts']))
+            stage_stats.update(diff.import_stats)
+        diff.log()
 
     @staticmethod
     def _populate_colors(csv_data):
         logger.info('Populate Colors')
+        import_stats = defaultdict(int)
+
+        existing_colors = Color.objects.in_bulk()
+
+        new_colors = []
+        changed_colors = []
+        for row in csv_data:
+            import_stats['read'] += 1
+            color_id = int(row['id'])
+            rgb = row['rgb']
+            name = row['name']
+            transparent = rebrickable_csv.parse_bool(row['is_trans'])
+
+            color = existing_colors.get(color_id)
+            if color is None:
+                new_colors.append(Color(id=color_id, rgb=rgb, name=name, transparent=transparent))
+            elif (color.rgb, color.name, color.transparent) != (rgb, name, transparent):
+                color.rgb = rgb
+                color.name = name
+                color.transparent = transparent
+                changed_colors.append(color)
+            else:
+                import_stats['skipped'] += 1
+
+        # bulk writes skip Color.save(), calculate the sort fields for the whole palette at once
+        touched_colors = new_colors + changed_colors
+        color_steps = Color.color_steps([Color.rgb_to_ints(c.rgb) for c in touched_colors])
+        for color, hlv in zip(touched_colors, color_steps):
+            color.set_color_steps(hlv)
+
         with transaction.atomic():
-            for row in csv_data:
-                rgb = row['rgb']
+            Color.objects.bulk_create(new_colors, batch_size=BULK_BATCH_SIZE)
+            Color.objects.bulk_update(
+                changed_colors,
+                ['rgb', 'name', 'transparent', 'color_step_hue', 'color_step_lumination', 'color_step_value'],
+                batch_size=BULK_BATCH_SIZE)
+        import_stats['inserted'] += len(new_colors)
+        import_stats['updated'] += len(changed_colors)
 
-                Color.objects.update_or_create(
-                    id=row['id'],
-                    defaults={
-                        'rgb': rgb,
-                        'name': row['name'],
-                        'transparent': row['is_trans']
-                    }
-                )
+        logger.info(F'  Colors Inserted: {import_stats["inserted"]}, Updated: {import_stats["updated"]}')
+        return import_stats
 
     @staticmethod
     def _populate_part_categories(csv_data):
         logger.info('Populate Part Categories')
+        import_stats = defaultdict(int)
+
+        existing_categories = PartCategory.objects.in_bulk()
+
+        new_categories = []
+        changed_categories = []
+        for row in csv_data:
+            import_stats['read'] += 1
+            category_id = int(row['id'])
+            name = row['name']
+
+            category = existing_categories.get(category_id)
+            if category is None:
+                new_categories.append(PartCategory(id=category_id, name=name))
+            elif category.name != name:
+                category.name = name
+                changed_categories.append(category)
+            else:
+                import_stats['skipped'] += 1
+
         with transaction.atomic():
-            for row in csv_data:
-                PartCategory.objects.update_or_create(
-                    id=row['id'],
-                    defaults={'name': row['name']})
+            PartCategory.objects.bulk_create(new_categories, batch_size=BULK_BATCH_SIZE)
+            PartCategory.objects.bulk_update(changed_categories, ['name'], batch_size=BULK_BATCH_SIZE)
+        import_stats['inserted'] += len(new_categories)
+        import_stats['updated'] += len(changed_categories)
+
+        logger.info(F'  Part Categories Inserted: {import_stats["inserted"]}, Updated: {import_stats["updated"]}')
+        return import_stats
 
     @staticmethod
     def _populate_parts(csv_data):
         logger.info('Populate Parts')
-        part_list = Part.objects.values_list('part_num', flat=True)
-        create_count = 0
+        import_stats = defaultdict(int)
+
+        # Load Parts and Categories once, lookups per csv row are then only dictionary hits
+        existing_parts = {p.part_num: p for p in Part.objects.select_related('category')}
+        categories = PartCategory.objects.in_bulk()
+
+        new_parts = []
+        changed_parts = []
         with transaction.atomic():
             for row in csv_data:
+                import_stats['read'] += 1
                 part_num = row['part_num']
-                if part_num not in part_list:
-                    Part.objects.create(
-                        part_num=row['part_num'],
-                        name=row['name'],
-                        category=PartCategory.objects.get(id=row['part_cat_id']))
-                    create_count += 1
-
-                    if (create_count % 1000) == 0:
-                        logger.info(F'  Parts Created {create_count}')
-        logger.info(F'  Total Parts Created {create_count}')
+                name = row['name']
+
+                category = categories.get(int(row['part_cat_id']))
+                if category is None:
+                    logger.warning(F'  Unknown Category "{row["part_cat_id"]}" for Part "{part_num}"')
+                    import_stats['skipped'] += 1
+                    continue
+
+                part = existing_parts.get(part_num)
+                if part is None:
+                    part = Part(part_num=part_num, name=name, category=category)
+                    part.normalize_dimensions()
+                    new_parts.append(part)
+
+                    if len(new_parts) >= BULK_BATCH_SIZE:
+                        Part.objects.bulk_create(new_parts, batch_size=BULK_BATCH_SIZE)
+                        import_stats['inserted'] += len(new_parts)
+                        new_parts.clear()
+                        logger.info(F'  Parts Created {import_stats["inserted"]}')
+                elif (part.name != name) or (part.category_id != category.id):
+                    old_dimensions = part.stored_dimensions
+                    part.name = name
+                    part.category = category
+                    part.normalize_dimensions()
+                    if part.stored_dimensions != old_dimensions:
+                        part.attributes_dirty = True
+                    changed_parts.append(part)
+                else:
+                    import_stats['skipped'] += 1
+
+            if new_parts:
+                Part.objects.bulk_create(new_parts, batch_size=BULK_BATCH_SIZE)
+                import_stats['inserted'] += len(new_parts)
+
+            if changed_parts:
+                Part.objects.bulk_update(
+                    changed_parts, ['name', 'category', 'height', 'attributes_dirty'], batch_size=BULK_BATCH_SIZE)
+                import_stats['updated'] += len(changed_parts)
+
+        logger.info(F'  Total Parts Created {import_stats["inserted"]}')
+        logger.info(F'  Total Parts Updated {import_stats["updated"]}')
+        return import_stats
 
     @staticmethod
     def _populate_relationships(csv_data):
         logger.info('Populate Relationships')
+        import_stats = defaultdict(int)
+
+        part_ids = dict(Part.objects.values_list('part_num', 'id'))
+        existing_relationships = {
+            (r.child_part_id, r.parent_part_id): r for r in PartRelationship.objects.all()}
+
+        new_relationships = []
+        changed_relationships = []
+        csv_keys = set()
         with transaction.atomic():
-            relation_mapping = {
-                'A': PartRelationship.ALTERNATE_PART,
-                'M': PartRelationship.DIFFERENT_MOLD,
-                'P': PartRelationship.DIFFERENT_PRINT,
-                'T': PartRelationship.DIFFERENT_PATTERN
-            }
-
-            part_list = Part.objects.values_list('part_num', flat=True)
-
-            for idx, row in enumerate(csv_data, 1):
-                rel_type = row['rel_type']
-                child_part_num = row['child_part_num']
-                parent_part_num = row['parent_part_num']
-
-                if (child_part_num in part_list) and (parent_part_num in part_list):
-                    child_part = Part.objects.filter(part_num=child_part_num).first()
-                    parent_part = Part.objects.filter(part_num=parent_part_num).first()
-
-                    if child_part and parent_part:
-                        PartRelationship.objects.update_or_create(
-                            child_part=child_part,
-                            parent_part=parent_part,
-                            defaults={'relationship_type': relation_mapping[rel_type]}
-                        )
-
-                        if (idx % 1000) == 0:
-                            logger.info(F'  Relationships Processed: {idx}')
+            for row in csv_data:
+                import_stats['read'] += 1
+                child_part_id = part_ids.get(row['child_part_num'])
+                parent_part_id = part_ids.get(row['parent_part_num'])
+
+                if (child_part_id is None) or (parent_part_id is None):
+                    import_stats['skipped'] += 1
+                    continue
+                csv_keys.add((child_part_id, parent_part_id))
+
+                relationship_type = PartRelationship.rebrickable_types[row['rel_type']]
+                relationship = existing_relationships.get((child_part_id, parent_part_id))
+                if relationship is None:
+                    relationship = PartRelationship(
+                        child_part_id=child_part_id,
+                        parent_part_id=parent_part_id,
+                        relationship_type=relationship_type)
+                    existing_relationships[(child_part_id, parent_part_id)] = relationship
+                    new_relationships.append(relationship)
+                elif relationship.relationship_type != relationship_type:
+                    relationship.relationship_type = relationship_type
+                    if relationship.pk is not None:
+                        changed_relationships.append(relationship)
+                else:
+                    import_stats['skipped'] += 1
+
+                if (import_stats['read'] % 1000) == 0:
+                    logger.info(F'  Relationships Processed: {import_stats["read"]}')
+
+            if new_relationships:
+                PartRelationship.objects.bulk_create(new_relationships, batch_size=BULK_BATCH_SIZE)
+                import_stats['inserted'] += len(new_relationships)
+
+            # Relationships no longer in the file are removed
+            removed_relationships = [r for key, r in existing_relationships.items() if key not in csv_keys]
+            with deferred_family_updates():
+                for idx in range(0, len(removed_relationships), BULK_BATCH_SIZE):
+                    PartRelationship.objects.filter(
+                        id__in=[r.id for r in removed_relationships[idx:idx + BULK_BATCH_SIZE]]).delete()
+            import_stats['deleted'] += len(removed_relationships)
+
+            # Only the families the added and removed relationships touch need to be recalculated
+            if new_relationships or removed_relationships:
+                update_part_families({part_id for r in new_relationships + removed_relationships
+                                      for part_id in (r.child_part_id, r.parent_part_id)})
+
+            if changed_relationships:
+                PartRelationship.objects.bulk_update(
+                    changed_relationships, ['relationship_type'], batch_size=BULK_BATCH_SIZE)
+                import_stats['updated'] += len(changed_relationships)
+
+        logger.info(F'  Relationships Inserted: {import_stats["inserted"]}, Updated: {import_stats["updated"]}, '
+                    F'Deleted: {import_stats["deleted"]}, Skipped: {import_stats["skipped"]}')
+        return import_stats
 
     @staticmethod
     def _populate_set_parts(csv_data):
         logger.info('Populate Set Parts')
+        return Command._sync_set_parts(rebrickable_csv.parse_inventory_part_row(row) for row in csv_data)
 
-        logger.info('  Deleting all Set Parts - Start')
-        with transaction.atomic():
-            SetPart.objects.all().delete()
-        logger.info('  Deleting all Set Parts - End')
+    @staticmethod
+    def _populate_set_parts_pipeline(csv_file, *, workers):
+        # Csv decoding and conversion runs in worker processes, this process stays the only DB writer
+        logger.info(F'Populate Set Parts, parsing with {workers} worker processes')
+        return Command._sync_set_parts(rebrickable_csv.parse_inventory_parts_parallel(csv_file, workers=workers))
 
-        batch_size = 999  # Max for Sqlite3
-        batch_list = []
-        csv_row_count = 0
+    @staticmethod
+    def _sync_set_parts(set_part_rows):  # pylint: disable=too-many-locals
+        import_stats = defaultdict(int)
 
-        # Load all Parts into memory otherwise bulk_crete gets slow
-        cached_parts = {p.part_num: p for p in Part.objects.all()}
+        part_ids = dict(Part.objects.values_list('part_num', 'id'))
 
-        logger.info('  Importing Set Parts - Start')
+        # Existing Set Parts keyed by their unique_together fields, what is left after the import is stale
+        logger.info('  Loading existing Set Parts')
+        existing_set_parts = {
+            (set_inventory, part_id, color_id, is_spare): (set_part_id, qty)
+            for set_part_id, set_inventory, part_id, color_id, is_spare, qty in SetPart.objects.values_list(
+                'id', 'set_inventory', 'part_id', 'color_id', 'is_spare', 'qty').iterator()
+        }
+
+        new_set_parts = []
+        changed_set_parts = []
+
+        logger.info('  Syncing Set Parts - Start')
+        start_time = time.perf_counter()
         with transaction.atomic():
-            for row in csv_data:
-                csv_row_count += 1
+            for set_part_row in set_part_rows:
+                import_stats['read'] += 1
+
+                if set_part_row is None:
+                    logger.debug(F'  Invalid Set Part row {import_stats["read"]}')
+                    import_stats['skipped'] += 1
+                    continue
+
+                set_inventory, part_num, color_id, qty, is_spare = set_part_row
+                part_id = part_ids.get(part_num)
+                if part_id is None:
+                    import_stats['skipped'] += 1
+                    continue
+
+                existing = existing_set_parts.pop((set_inventory, part_id, color_id, is_spare), None)
+                if existing is None:
+                    new_set_parts.append(SetPart(
+                        set_inventory=set_inventory, part_id=part_id, color_id=color_id, qty=qty, is_spare=is_spare))
+                elif existing[1] != qty:
+                    changed_set_parts.append(SetPart(id=existing[0], qty=qty))
+                else:
+                    import_stats['skipped'] += 1
+
+                if len(new_set_parts) >= BULK_BATCH_SIZE:
+                    SetPart.objects.bulk_create(new_set_parts)
+                    import_stats['inserted'] += len(new_set_parts)
+                    new_set_parts.clear()
+
+                if len(changed_set_parts) >= BULK_BATCH_SIZE:
+                    SetPart.objects.bulk_update(changed_set_parts, ['qty'])
+                    import_stats['updated'] += len(changed_set_parts)
+                    changed_set_parts.clear()
+
+                if (import_stats['read'] % 50000) == 0:
+                    logger.info(F'  SetParts Processed: {import_stats["read"]}')
+
+            if new_set_parts:
+                SetPart.objects.bulk_create(new_set_parts)
+                import_stats['inserted'] += len(new_set_parts)
+
+            if changed_set_parts:
+                SetPart.objects.bulk_update(changed_set_parts, ['qty'])
+                import_stats['updated'] += len(changed_set_parts)
+
+            # Remove Set Parts no longer in the csv
+            stale_ids = [set_part_id for set_part_id, _ in existing_set_parts.values()]
+            for idx in range(0, len(stale_ids), BULK_BATCH_SIZE):
+                SetPart.objects.filter(id__in=stale_ids[idx:idx + BULK_BATCH_SIZE]).delete()
+            import_stats['deleted'] += len(stale_ids)
+
+        elapsed = time.perf_counter() - start_time
+        logger.info(F'  Syncing Set Parts - End, {import_stats["read"]} rows in {elapsed:.1f}s '
+                    F'({import_stats["read"] / max(elapsed, 0.001):.0f} rows/sec)')
+        logger.info(F'  Total SetParts Processed: {import_stats["read"]}, Inserted: {import_stats["inserted"]}, '
+                    F'Updated: {import_stats["updated"]}, Deleted: {import_stats["deleted"]}')
+        return import_stats
 
-                batch_list.append(
-                    SetPart(
-                        set_inventory=row['inventory_id'],
-                        color_id=row['color_id'],
-                        part=cached_parts[row['part_num']],
-                        qty=row['quantity'],
-                        is_spare=row['is_spare'])
-                )
+    @staticmethod
+    def _find_import_files(import_path, names):
+        # The import path can be a directory of csv or csv.gz files or a zip archive containing them
+        if os.path.isdir(import_path):
+            available_files = {file_name: os.path.join(import_path, file_name)
+                               for file_name in os.listdir(import_path)}
+        elif zipfile.is_zipfile(import_path):
+            with zipfile.ZipFile(import_path) as zip_file:
+                available_files = {os.path.basename(member): member for member in zip_file.namelist()}
+        else:
+            raise ValueError(F'{import_path} is not a valid Directory or Zip File')
+
+        # Check all expected files are present
+        import_files = {}
+        for name in names:
+            for file_name in (F'{name}.csv', F'{name}.csv.gz'):
+                if file_name in available_files:
+                    import_files[name] = available_files[file_name]
+                    break
+            else:
+                raise ValueError(F'Expected file "{name}.csv" or "{name}.csv.gz" not found in "{import_path}"')
 
-                if (csv_row_count % batch_size) == 0:
-                    SetPart.objects.bulk_create(batch_list)
-                    batch_list.clear()
-                    logger.debug(F'  SetParts Created: {csv_row_count}')
+        return import_files
 
-                if (csv_row_count % 50000) == 0:
-                    logger.info(F'  SetParts Processed: {csv_row_count}')
+    @staticmethod
+    @contextmanager
+    def _open_import_file_binary(import_path, file_path):
+        # Decompress as a stream, nothing is extracted to disk
+        with ExitStack() as stack:
+            if os.path.isdir(import_path):
+                binary_file = stack.enter_context(open(file_path, 'rb'))
+            else:
+                zip_file = stack.enter_context(zipfile.ZipFile(import_path))
+                binary_file = stack.enter_context(zip_file.open(file_path))
 
-            if batch_list:
-                SetPart.objects.bulk_create(batch_list)
+            if file_path.endswith('.gz'):
+                binary_file = stack.enter_context(gzip.GzipFile(fileobj=binary_file))
 
-        logger.info('  Importing Set Parts - End')
-        logger.info(F'  Total SetParts Processed: {csv_row_count}')
+            yield binary_file
 
     @staticmethod
-    def _validate_config_path(base_path, expected_file_list):
-        # Check path exists as directory
-        if not os.path.exists(base_path) or not os.path.isdir(base_path):
-            raise ValueError(F'{base_path} is not a valid DIrectory')
+    @contextmanager
+    def _open_import_file(import_path, file_path):
+        with Command._open_import_file_binary(import_path, file_path) as binary_file:
+            with io.TextIOWrapper(binary_file, encoding='utf8', newline='') as text_file:
+                yield text_file
 
-        # Check all expected files are present
-        for file_path in expected_file_list:
-            if not os.path.exists(file_path):
-                raise ValueError(F'Expected file "{file_path}" not found')
+    @staticmethod
+    def _hash_import_file(import_path, file_path):
+        # Hash the decompressed content, recompressing the same data must not count as a change
+        content_hash = hashlib.sha256()
+        with Command._open_import_file_binary(import_path, file_path) as binary_file:
+            for chunk in iter(lambda: binary_file.read(HASH_CHUNK_SIZE), b''):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
@@ -1,14 +1,20 @@
+import hashlib
 import json
 import logging
 import os
 
-from django.core.management.base import BaseCommand
+from collections import defaultdict, namedtuple
+
 from django.db import transaction
 
+from inventory.management.telemetry import ReportCommand
 from inventory.models import Part, PartExternalId
+from utils import json_stream
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+BULK_BATCH_SIZE = 999  # Max for Sqlite3
+
 
 TEXT_TO_PROVIDER_DIC = {
     'BrickLink': PartExternalId.BRICKLINK,
@@ -19,8 +25,10 @@ TEXT_TO_PROVIDER_DIC = {
     'Peeron': PartExternalId.PEERON
 }
 
+_ScrapedBatch = namedtuple('_ScrapedBatch', ['changed_parts', 'image_changed_parts', 'new_external_ids'])
+
 
-class Command(BaseCommand):
+class Command(ReportCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('json_file_path', type=str)
@@ -28,54 +36,89 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         json_file_path = options['json_file_path']
 
-        json_dic = {}
-        if os.path.exists(json_file_path):
-            with open(json_file_path, 'r', encoding='utf-8') as file_ptr:
-                json_dic = json.load(file_ptr)
-        else:
-            logger.error(F'ERROR - Json file "{json_file_path}" does not exist')
-
-        self.import_scraped_data(json_dic['parts'])
+        with self.report.stage('scraped_parts') as stage_stats:
+            if os.path.exists(json_file_path):
+                with open(json_file_path, 'r', encoding='utf-8') as file_ptr:
+                    stage_stats.update(self.import_scraped_data(json_stream.iter_object_items(file_ptr, ['parts'])))
+            else:
+                logger.error(F'ERROR - Json file "{json_file_path}" does not exist')
 
-    def import_scraped_data(self, data_dic):
+    def import_scraped_data(self, part_items):
+        # All counts are in parts, except external_ids_inserted
         logger.info('Importing Scraped Data')
-        external_id_counts = 0
-        parts_processed_counts = 0
-        part_list = Part.objects.values_list('part_num', flat=True)
+        import_stats = defaultdict(int)
+        existing_external_ids = set(PartExternalId.objects.values_list('part_id', 'provider', 'external_id'))
 
+        batch = _ScrapedBatch(changed_parts=[], image_changed_parts=[], new_external_ids=[])
         with transaction.atomic():
-            for part_num, part_dic in data_dic.items():  # pylint: disable=too-many-nested-blocks
-                if part_num in part_list:
-                    part = Part.objects.filter(part_num=part_num).first()
-                    if part:
-
-                        # Import image url
-                        part_img_url = part_dic['part_img_url']
-                        if part_img_url:
-                            part.image_url = part_img_url
-                            part.save()
-
-                        # Import External IDs
-                        for name, ids in part_dic['external_ids'].items():
-                            provider = self.provider_from_string(name)
-                            for entry in ids:
-                                # Is this better than check if exist first?
-                                PartExternalId.objects.update_or_create(
-                                    part=part,
-                                    external_id=entry.strip(),
-                                    provider=provider
-                                )
-                                external_id_counts += 1
-
-                                if (external_id_counts % 1000) == 0:
-                                    logger.debug(F'    {external_id_counts} External IDs imported')
-
-                        parts_processed_counts += 1
-                        if (parts_processed_counts % 1000) == 0:
-                            logger.info(F'  {parts_processed_counts} Parts Processed')
-
-        logger.info(F'Total of {parts_processed_counts} DB Parts Processed')
-        logger.info(F'Total of {external_id_counts} External IDs imported')
+            for changed_part in self._changed_parts(part_items, import_stats):
+                self._add_to_batch(batch, changed_part, existing_external_ids)
+
+                if (len(batch.new_external_ids) >= BULK_BATCH_SIZE
+                        or (len(batch.changed_parts) + len(batch.image_changed_parts)) >= BULK_BATCH_SIZE):
+                    self._write_batch(batch, import_stats)
+
+            self._write_batch(batch, import_stats)
+
+        logger.info(F'Total of {import_stats["updated"]} DB Parts Processed')
+        logger.info(F'Total of {import_stats["external_ids_inserted"]} External IDs imported')
+        import_stats['skipped'] = import_stats['read'] - import_stats['updated']
+        return import_stats
+
+    def _changed_parts(self, part_items, import_stats):
+        # Yields (part_id, image_url, part_hash, part_dic) for the known parts whose scraped data changed
+        parts = {part_num: (part_id, image_url, scraped_hash) for part_num, part_id, image_url, scraped_hash
+                 in Part.objects.values_list('part_num', 'id', 'image_url', 'scraped_hash')}
+
+        for part_num, part_dic in part_items:
+            import_stats['read'] += 1
+            if part_num not in parts:
+                continue
+
+            part_id, image_url, scraped_hash = parts[part_num]
+            part_hash = self.scraped_hash(part_dic)
+            if part_hash != scraped_hash:
+                yield (part_id, image_url, part_hash, part_dic)
+
+    def _add_to_batch(self, batch, changed_part, existing_external_ids):
+        part_id, image_url, part_hash, part_dic = changed_part
+
+        # Import image url, only a new image marks the part dirty for set_related_attributes
+        new_image_url = part_dic['part_img_url'] or image_url
+        if new_image_url != image_url:
+            batch.image_changed_parts.append(Part(
+                id=part_id, image_url=new_image_url, scraped_hash=part_hash, attributes_dirty=True))
+        else:
+            batch.changed_parts.append(Part(id=part_id, image_url=image_url, scraped_hash=part_hash))
+
+        # Import External IDs
+        for name, ids in part_dic['external_ids'].items():
+            provider = self.provider_from_string(name)
+            for entry in ids:
+                external_id_key = (part_id, provider, entry.strip())
+                if external_id_key not in existing_external_ids:
+                    existing_external_ids.add(external_id_key)
+                    batch.new_external_ids.append(PartExternalId(
+                        part_id=part_id, provider=provider, external_id=external_id_key[2]))
+
+    @staticmethod
+    def _write_batch(batch, import_stats):
+        PartExternalId.objects.bulk_create(batch.new_external_ids, batch_size=BULK_BATCH_SIZE, ignore_conflicts=True)
+        Part.objects.bulk_update(batch.changed_parts, ['image_url', 'scraped_hash'], batch_size=BULK_BATCH_SIZE)
+        Part.objects.bulk_update(
+            batch.image_changed_parts, ['image_url', 'scraped_hash', 'attributes_dirty'], batch_size=BULK_BATCH_SIZE)
+
+        import_stats['external_ids_inserted'] += len(batch.new_external_ids)
+        import_stats['updated'] += len(batch.changed_parts) + len(batch.image_changed_parts)
+        if batch.changed_parts or batch.image_changed_parts:
+            logger.info(F'  {import_stats["updated"]} Parts Processed')
+
+        for batch_list in batch:
+            batch_list.clear()
+
+    @staticmethod
+    def scraped_hash(part_dic):
+        return hashlib.sha256(json.dumps(part_dic, sort_keys=True).encode('utf-8')).hexdigest()
 
     @staticmethod
     def provider_from_string(text):
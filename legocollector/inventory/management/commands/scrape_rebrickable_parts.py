@@ -2,60 +2,221 @@ import csv
 import json
 import logging
 import os
+import socket
 import time
 
-from django.core.management.base import BaseCommand, CommandError
-from ezscrape.scraping import scraper
-from ezscrape.scraping.core import ScrapeConfig
-from ezscrape.scraping.core import ScrapeStatus
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import quote
 
+from django.core.management.base import CommandError
+
+from inventory.management.telemetry import ReportCommand
 from inventory.models import Part
+from utils.json_journal import JsonJournal, write_json_atomic
+from utils.rate_limit import RetryPolicy, TokenBucket
+from utils.rebrickable_fetch import AdaptiveBatchSize, FetchError, JsonFetcher
+from utils.scrape_cache import CachePolicy, ScrapeCache
+from utils.scrape_queue import ScrapeQueue
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+REBRICKABLE_PARTS_URL = 'https://rebrickable.com/api/v3/lego/parts/'
+MAX_URL_LENGTH = 4000
+
+
+# State shared by the batches of one run
+_ScrapeRun = namedtuple('_ScrapeRun', ['queue', 'journal', 'data_dic', 'import_stats'])
 
-class Command(BaseCommand):
+
+class Command(ReportCommand):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.parts_per_scrape = 100
+        self.batch_size = AdaptiveBatchSize(100)
+        self.workers = 1
+        self.base_url = REBRICKABLE_PARTS_URL
+        self.retry = RetryPolicy(TokenBucket(0.5))
+        self.cache_policy = CachePolicy()
+        self.queue_path = None
+        self.reset_queue = False
 
     def add_arguments(self, parser):
         parser.add_argument('rebrickabe_api_key', type=str)
         parser.add_argument('json_file_path', type=str)
         parser.add_argument('-p', '--parts_from_csv', type=str, help='Loads the Parts from a csv instead of the DB', )
+        parser.add_argument(
+            '--workers', type=int, default=1, help='Number of requests in flight at the same time')
+        parser.add_argument(
+            '--requests-per-second', type=float, default=0.5,
+            help='Request rate limit shared by all workers, keep it within the Rebrickable API quota')
+        parser.add_argument(
+            '--max-retries', type=int, default=5, help='Retries per request on errors, with exponential backoff')
+        parser.add_argument(
+            '--max-batch-size', type=int, default=1000,
+            help='Upper limit for the parts per request, the batch size adapts to the request latency')
+        parser.add_argument(
+            '--target-latency', type=float, default=2.0, help='Seconds per request the batch size is adapted to')
+        parser.add_argument('--base-url', type=str, default=REBRICKABLE_PARTS_URL, help='Rebrickable parts API url')
+        parser.add_argument(
+            '--cache-path', type=str, help='Sqlite file caching the raw results and when each part was fetched')
+        parser.add_argument(
+            '--max-age', type=float, help='Hours a cached part stays fresh, only stale and new parts are scraped')
+        parser.add_argument(
+            '--queue-path', type=str,
+            help='Sqlite job queue file, can be shared by several scraper processes. Defaults to a file per json file')
+        parser.add_argument(
+            '--reset-queue', action='store_true',
+            help='Start a new campaign on a reused --queue-path, parts done in the last campaign are scraped again')
+        parser.add_argument(
+            '--offline', action='store_true', help='Only use the cached results, parts not cached stay unscraped')
 
     def handle(self, *args, **options):
         rebrickabe_api_key = options['rebrickabe_api_key']
         json_file_path = options['json_file_path']
         parts_csv_path = options['parts_from_csv']
 
-        self.scrape_rebrickable_parts(rebrickabe_api_key, json_file_path, parts_csv_path)
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        if options['requests_per_second'] <= 0:
+            raise CommandError('--requests-per-second must be positive')
+
+        self.workers = options['workers']
+        self.base_url = options['base_url']
+        self.retry = RetryPolicy(TokenBucket(options['requests_per_second']), max_retries=options['max_retries'])
+        self.batch_size = AdaptiveBatchSize(
+            min(100, options['max_batch_size']), minimum=min(10, options['max_batch_size']),
+            maximum=options['max_batch_size'], target_latency=options['target_latency'])
+
+        if (options['max_age'] is not None or options['offline']) and not options['cache_path']:
+            raise CommandError('--max-age and --offline need a --cache-path')
+        max_age = options['max_age'] * 3600 if options['max_age'] is not None else None
+        self.queue_path = options['queue_path']
+        self.reset_queue = options['reset_queue']
+
+        with self.report.stage('scrape_parts') as stage_stats:
+            if options['cache_path']:
+                with ScrapeCache(options['cache_path']) as cache:
+                    self.cache_policy = CachePolicy(cache, max_age=max_age, offline=options['offline'])
+                    stage_stats.update(
+                        self.scrape_rebrickable_parts(rebrickabe_api_key, json_file_path, parts_csv_path))
+            else:
+                stage_stats.update(self.scrape_rebrickable_parts(rebrickabe_api_key, json_file_path, parts_csv_path))
 
     def scrape_rebrickable_parts(self, api_key, json_file_path, part_csv_path):
         logger.info('Scraping Rebrickable Parts')
+        import_stats = defaultdict(int)
 
-        # Get the data to scrape
-        part_nums, data_dic = self._load_scrape_data(json_file_path, part_csv_path)
+        # Recover the batches a previous run journaled before it stopped
+        journal = JsonJournal(F'{json_file_path}.journal')
+        self._compact_journal(json_file_path, journal)
 
-        # Get the list to scrape next
-        scrape_list, part_nums = self._get_scrape_list(part_nums, self.parts_per_scrape)
-        while scrape_list:
-            # Do the scraping
-            scrape_data = self._scrape(self._form_scrape_url(scrape_list, api_key))
-            if scrape_data:
-                data_dic = self._process_scrape_result(scrape_data, data_dic)
-                self._save_scrape(json_file_path, data_dic, part_nums)
-            else:
-                self._save_scrape(json_file_path, data_dic, part_nums + scrape_list)
+        # Get the data to scrape, the starting point is saved once and batches are journaled from there
+        part_nums, data_dic = self._load_scrape_data(json_file_path, part_csv_path)
+        part_nums, data_dic = self._use_cached_results(part_nums, data_dic, import_stats)
+        self._save_scrape(json_file_path, data_dic, part_nums)
+
+        if self.cache_policy.offline:
+            logger.info(F'  Offline, {len(part_nums)} Parts not in the cache stay unscraped')
+            return import_stats
+
+        queue_path = self.queue_path or F'{json_file_path}.queue'
+        with ScrapeQueue(queue_path, owner=self._queue_owner(json_file_path)) as queue:
+            if self.reset_queue:
+                queue.clear()
+
+            # Batches this scraper held when it stopped don't wait for their lease to expire
+            released_count = queue.release_own_claims()
+            if released_count:
+                logger.info(F'  {released_count} Parts claimed by an earlier run released')
+
+            # Parts that failed in an earlier run get another chance, parts already queued keep their status
+            queue.requeue_failed()
+            queue.add(part_nums)
+            self._warn_done_parts(queue, part_nums, data_dic)
+            self._process_queue(_ScrapeRun(queue, journal, data_dic, import_stats), api_key)
+
+            # With a shared queue this includes the parts other processes have in flight
+            unscraped_part_nums = queue.unfinished_part_nums()
+            logger.info(F'  Queue Status: {queue.status_counts()}')
+
+        self._save_scrape(json_file_path, data_dic, unscraped_part_nums)
+        journal.clear()
+        if not (self.queue_path or unscraped_part_nums):
+            os.remove(queue_path)
 
-            # Get the next Part Nums to scrape
-            scrape_list, part_nums = self._get_scrape_list(part_nums, self.parts_per_scrape)
+        logger.info('Scraping Complete')
+        return import_stats
+
+    def _process_queue(self, run, api_key):
+        # Keep up to "workers" batches in flight, the rate limiter spaces out the actual requests
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, JsonFetcher(pool_size=self.workers) as fetcher:
+            while True:
+                while len(pending) < self.workers:
+                    batch_id, scrape_list = self._claim_scrape_list(run.queue, api_key)
+                    if not scrape_list:
+                        break
+                    run.import_stats['read'] += len(scrape_list)
+                    future = executor.submit(
+                        self._scrape, fetcher, self._form_scrape_url(scrape_list, api_key, self.base_url))
+                    pending[future] = (batch_id, scrape_list)
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch_id, scrape_list = pending.pop(future)
+                    self._finish_batch(run, batch_id, scrape_list, future.result())
+
+    def _finish_batch(self, run, batch_id, scrape_list, scrape_result):
+        scrape_data, latency = scrape_result
+        if latency is not None:
+            self.batch_size.record(len(scrape_list), latency)
+
+        if not scrape_data:
+            # Failed parts stay unscraped for the next run
+            run.queue.fail(batch_id)
+            run.import_stats['skipped'] += len(scrape_list)
+            return
+
+        # Journal before marking the batch done, a crash in between only repeats the batch
+        run.journal.append({'part_nums': scrape_list, 'results': scrape_data['results']})
+        changed_count = self.cache_policy.store(scrape_list, scrape_data['results'])
+        if changed_count is not None:
+            logger.info(F'  {changed_count} of {len(scrape_data["results"])} Results changed')
+        self._process_scrape_result(scrape_data, run.data_dic)
+        run.queue.complete(batch_id)
+        run.import_stats['inserted'] += len(scrape_data['results'])
 
-            # delay between scrape attempts
-            time.sleep(2)
+    @staticmethod
+    def _queue_owner(json_file_path):
+        # Stable across restarts, a scraper is identified by its host and the json file it writes
+        return F'{socket.gethostname()}:{os.path.abspath(json_file_path)}'
 
-        logger.info('Scraping Complete')
+    @staticmethod
+    def _warn_done_parts(queue, part_nums, data_dic):
+        # Parts done in the queue are not scraped again, with a reused queue file they may be from an older campaign
+        unfinished_part_nums = set(queue.unfinished_part_nums())
+        done_count = len([p for p in part_nums if (p not in unfinished_part_nums) and (p not in data_dic)])
+        if done_count:
+            logger.warning(F'  {done_count} Parts are done in the queue "{queue.path}" and are not scraped, '
+                           F'use --reset-queue to start a new campaign')
+
+    def _use_cached_results(self, part_nums, data_dic, import_stats):
+        # Fresh cached parts are not scraped again, offline every cached part is used regardless of age
+        cached_results = self.cache_policy.cached_results(part_nums)
+        if not cached_results:
+            return (part_nums, data_dic)
+
+        data_dic = self._process_scrape_result(
+            {'results': [result for result in cached_results.values() if result is not None]}, data_dic)
+        import_stats['read'] += len(cached_results)
+        import_stats['skipped'] += len(cached_results)
+        logger.info(F'  {len(cached_results)} Parts taken from the cache')
+
+        return ([part_num for part_num in part_nums if part_num not in cached_results], data_dic)
 
     @staticmethod
     def _get_part_nums_from_rebrickable_csv(part_csv_path):
@@ -67,24 +228,30 @@ class Command(BaseCommand):
 
         return part_num_list
 
-    @staticmethod
-    def _get_scrape_list(part_nums, count):
-        scrape_list = []
-        leftover_part_nums = []
+    def _claim_scrape_list(self, queue, api_key):
+        # Claim up to the current batch size and hand back the part_nums that would make the url too long
+        batch_id, part_nums = queue.claim(self.batch_size.size)
 
-        if len(part_nums) > count:
-            scrape_list = part_nums[:count]
-            leftover_part_nums = part_nums[count:]
-        else:
-            scrape_list = part_nums
+        url_length = len(self._form_scrape_url([], api_key, self.base_url)) + len(str(len(part_nums)))
+        count = 0
+        for part_num in part_nums:
+            url_length += len(quote(part_num, safe='')) + 1
+            if count and (url_length > MAX_URL_LENGTH):
+                break
+            count += 1
 
-        return (scrape_list, leftover_part_nums)
+        if count < len(part_nums):
+            queue.release(batch_id, part_nums[count:])
+        return (batch_id, part_nums[:count])
 
     @staticmethod
-    def _form_scrape_url(part_nums, api_key):
-        part_list_str = ','.join(part_nums)
+    def _form_scrape_url(part_nums, api_key, base_url=REBRICKABLE_PARTS_URL):
+        # Quoted the same way as the url length budget in _claim_scrape_list
+        part_list_str = ','.join(quote(part_num, safe='') for part_num in part_nums)
         # to include part relationships, add "&inc_part_details=1" to the url
-        return F'https://rebrickable.com/api/v3/lego/parts/?part_nums={part_list_str}&key={api_key}&inc_part_details=1'
+        # page_size makes sure all parts of the batch are returned in one page, the api default is 100
+        return (F'{base_url}?part_nums={part_list_str}&page_size={len(part_nums)}'
+                F'&key={api_key}&inc_part_details=1')
 
     @staticmethod
     def _load_scrape_data(json_file_path, part_csv_path):
@@ -116,18 +283,24 @@ class Command(BaseCommand):
 
         return (part_nums, part_dic)
 
-    @staticmethod
-    def _scrape(url):
+    def _scrape(self, fetcher, url):
+        # Returns (json result, request latency), ({}, None) if all attempts failed
         logger.info(F'  Scraping Url: {url}')
-        json_result = {}
 
-        result = scraper.scrape_url(ScrapeConfig(url))
-        if result.status == ScrapeStatus.SUCCESS:
-            json_result = json.loads(result.first_page.html)
-        else:
-            logger.error(F'Scraping Issue: {result.error_msg}')
+        for attempt in range(self.retry.max_retries + 1):
+            if attempt:
+                delay = self.retry.delay(attempt)
+                logger.info(F'  Retry {attempt}/{self.retry.max_retries} in {delay}s')
+                time.sleep(delay)
+
+            self.retry.acquire()
+            try:
+                return fetcher.fetch_json(url)
+            except FetchError as error:
+                # Includes "HTTP Error: 429" when over the API quota, the backoff gives it time to recover
+                logger.error(F'Scraping Issue: {error}')
 
-        return json_result
+        return ({}, None)
 
     @staticmethod
     def _save_scrape(json_file_path, data_dic, unscraped_list):
@@ -136,8 +309,27 @@ class Command(BaseCommand):
         json_dic['unscraped_parts'] = unscraped_list
         json_dic['parts'] = data_dic
 
-        with open(json_file_path, 'w', encoding='utf-8') as file_ptr:
-            json.dump(json_dic, file_ptr)
+        write_json_atomic(json_file_path, json_dic)
+
+    @staticmethod
+    def _compact_journal(json_file_path, journal):
+        # Replay the journal onto the saved state, replaying twice gives the same result
+        if not journal.exists():
+            return
+
+        logger.info(F'  Replaying Scrape Journal "{journal.path}"')
+        with open(json_file_path, 'r', encoding='utf-8') as file_ptr:
+            json_dic = json.load(file_ptr)
+
+        data_dic = json_dic['parts']
+        scraped_part_nums = set()
+        for record in journal.records():
+            data_dic = Command._process_scrape_result(record, data_dic)
+            scraped_part_nums.update(record['part_nums'])
+
+        unscraped_list = [part_num for part_num in json_dic['unscraped_parts'] if part_num not in scraped_part_nums]
+        Command._save_scrape(json_file_path, data_dic, unscraped_list)
+        journal.clear()
 
     @staticmethod
     def _process_scrape_result(scrape_result, data_dic):
@@ -3,37 +3,70 @@ import logging
 from collections import defaultdict
 
 from django.db import transaction
-from django.core.management.base import BaseCommand
+from inventory.management.telemetry import ReportCommand
 from inventory.models import Part
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
+BULK_BATCH_SIZE = 999  # Max for Sqlite3
+REL_ATTRIB_FIELDS = ['width', 'height', 'length', 'top_studs', 'bottom_studs', 'stud_rings', 'image_url']
 
-class Command(BaseCommand):
 
-    def handle(self, *args, **options):  # pylint: disable=too-many-locals, too-many-branches, too-many-statements
-        logger.info('Calculating Related Part Attributes')
+class Command(ReportCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only process the families of parts changed since the last run')
 
-        processed_parts = {}
+    def handle(self, *args, **options):
+        logger.info('Calculating Related Part Attributes')
 
         attribute_updates = defaultdict(int)
 
-        with transaction.atomic():
-            for idx, part in enumerate(Part.objects.all(), 1):
-                if part.part_num not in processed_parts:
-                    # Update Related Parts
-                    part_list = self.set_related_attribs_for_part(
-                        part, attribute_updates=attribute_updates)
+        with self.report.stage('related_attributes') as stage_stats, transaction.atomic():
+            part_families = self.get_part_families(dirty_only=options['incremental'])
+            logger.info(F'  {len(part_families)} Part Families Found')
 
-                    # Remember Processed Parts
-                    for rel_part in part_list:
-                        processed_parts[rel_part.part_num] = True
+            changed_parts = []
+            for idx, part_family in enumerate(part_families, 1):
+                stage_stats['read'] += len(part_family)
+                changed_parts += self.set_family_attribs(part_family, attribute_updates=attribute_updates)
 
                 if (idx % 1000) == 0:
-                    logger.info(F'  {idx} Parts Processed')
+                    logger.info(F'  {idx} Part Families Processed')
+
+            # bulk_update doesn't call save()
+            for part in changed_parts:
+                part.normalize_dimensions()
+            Part.objects.bulk_update(changed_parts, REL_ATTRIB_FIELDS, batch_size=BULK_BATCH_SIZE)
+
+            # Every family is up to date now, including those of dirty parts without relationships
+            Part.objects.filter(attributes_dirty=True).update(attributes_dirty=False)
+
+            stage_stats['updated'] = attribute_updates['total_parts']
+            stage_stats['skipped'] = stage_stats['read'] - stage_stats['updated']
 
         self.print_update_details(attribute_updates)
 
+    @staticmethod
+    def get_part_families(*, dirty_only=False):
+        # Parts connected through any chain of relationships share a family_id, parts without relationships have none.
+        # With dirty_only only the families with at least one dirty part are returned.
+        parts = Part.objects.select_related('category').filter(family_id__isnull=False)
+        if dirty_only:
+            parts = parts.filter(family_id__in=Part.objects.filter(
+                attributes_dirty=True, family_id__isnull=False).values('family_id'))
+
+        part_families = []
+        family_id = None
+        for part in parts.order_by('family_id', 'id').iterator():
+            if part.family_id != family_id:
+                family_id = part.family_id
+                part_families.append([])
+            part_families[-1].append(part)
+
+        return part_families
+
     @staticmethod
     def print_update_details(attribute_updates):
         logger.info('  Attribute updates')
@@ -44,25 +77,21 @@ class Command(BaseCommand):
             logger.info(F'    {group:<20}: Count: {count}')
 
     @staticmethod
-    def set_related_attribs_for_part(part, *, attribute_updates):
+    def set_family_attribs(part_family, *, attribute_updates):
+        # Sets the missing attributes on the family parts and returns the changed parts, saving is up to the caller.
         # For Processing Stud Counts we need to be carefull as related parts may have a different stud count
         # e.g. the following 2 related parts have a different stud count
         #       https://rebrickable.com/parts/10a/baseplate-24-x-32-with-squared-corners/
         #       https://rebrickable.com/parts/10b/baseplate-24-x-32-with-rounded-corners/
-
-        # Get list of Related Parts
-        related_parts = part.get_related_parts(parents=True, children=True, transitive=True)
-        part_family = sorted(related_parts + [part], key=lambda p: p.dimension_set_count, reverse=True)
-
-        rel_attrib_fields = ['width', 'height', 'length', 'top_studs', 'bottom_studs', 'stud_rings', 'image_url']
+        part_family = sorted(part_family, key=lambda p: p.dimension_set_count, reverse=True)
 
         # Get master Dimension to set
         master_part = part_family[0]
         master_attribs = {name: getattr(master_part, name)
-                          for name in rel_attrib_fields if getattr(master_part, name) is not None}
+                          for name in REL_ATTRIB_FIELDS if getattr(master_part, name) is not None}
 
         # Fill the rest with non clashing attribs
-        for field in rel_attrib_fields:
+        for field in REL_ATTRIB_FIELDS:
             if field not in master_attribs:
                 for rel_part in part_family:
                     val = getattr(rel_part, field)
@@ -71,6 +100,7 @@ class Command(BaseCommand):
                         break
 
         # Set the default Attribs
+        changed_parts = []
         for rel_part in part_family:
             part_update = False
             for field, value in master_attribs.items():
@@ -80,10 +110,10 @@ class Command(BaseCommand):
                     part_update = True
 
             if part_update:
-                rel_part.save()
+                changed_parts.append(rel_part)
                 attribute_updates['total_parts'] += 1
 
                 if (attribute_updates['total_parts'] % 1000) == 0:
                     logger.info(F'''  Attributes Updated: {attribute_updates['total_parts']}''')
 
-        return part_family
+        return changed_parts
@@ -2,20 +2,21 @@ import logging
 
 from collections import defaultdict
 
-from django.core.management.base import BaseCommand
-
+from inventory.management.telemetry import ReportCommand
 from inventory.models import Part, PartCategory
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
-class Command(BaseCommand):
+class Command(ReportCommand):
 
     def handle(self, *args, **options):  # pylint: disable=too-many-locals, too-many-branches, too-many-statements
         logger.info('Show Database Details')
 
-        self.show_category_details()
-        self.show_part_details()
+        with self.report.stage('category_details') as stage_stats:
+            stage_stats['read'] = self.show_category_details()
+        with self.report.stage('part_details') as stage_stats:
+            stage_stats['read'] = self.show_part_details()
 
     @staticmethod
     def show_part_details():
@@ -55,9 +56,15 @@ class Command(BaseCommand):
         for dimension_count, part_count in sorted(dimension_set_count.items()):
             logger.info(F'    {dimension_count:<2}: {part_count}')
 
+        return sum(dimension_set_count.values())
+
     @staticmethod
     def show_category_details():
         logger.info('### CATEGORIES ###')
 
+        category_count = 0
         for category in PartCategory.objects.all().iterator():
+            category_count += 1
             logger.info(F'Part Count: {category.parts.all().count():<5} x {category.name}')
+
+        return category_count
@@ -0,0 +1,202 @@
+import csv
+import logging
+import math
+
+from collections import defaultdict
+
+from django.db.models import F
+from django.db.models.functions import Mod
+
+from inventory.models import Color, PartCategory, Part, PartRelationship, SetPart
+from utils import rebrickable_csv
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DIFF_SAMPLE_SIZE = 5
+DRY_RUN_PARTITION_ROWS = 250000
+
+
+class ImportDiff():
+    # Counts what an import would change, plus a few samples of every change type
+
+    def __init__(self, name, *, sample_size=DIFF_SAMPLE_SIZE):
+        self.name = name
+        self.sample_size = sample_size
+        self.import_stats = defaultdict(int)
+        self.samples = defaultdict(list)
+
+    def add(self, change, description=None):
+        self.import_stats[change] += 1
+        if (description is not None) and (len(self.samples[change]) < self.sample_size):
+            self.samples[change].append(description)
+
+    def log(self):
+        logger.info(F'Dry Run - {self.name}: Read: {self.import_stats["read"]}, '
+                    F'Inserts: {self.import_stats["inserted"]}, Updates: {self.import_stats["updated"]}, '
+                    F'Deletes: {self.import_stats["deleted"]}, Skipped: {self.import_stats["skipped"]}')
+        for change in ('inserted', 'updated', 'deleted'):
+            for sample in self.samples[change]:
+                logger.info(F'    {change:<8}: {sample}')
+
+
+class DryRunImport():
+    # Compares the import files with the database without writing, later files see the rows earlier ones would add
+
+    def __init__(self):
+        self.new_category_ids = set()
+        self.new_part_nums = set()
+
+    def diff_colors(self, csv_data):  # pylint: disable=no-self-use
+        diff = ImportDiff('Colors')
+        existing_colors = {color_id: (name, rgb, transparent) for color_id, name, rgb, transparent
+                           in Color.objects.values_list('id', 'name', 'rgb', 'transparent')}
+
+        for row in csv_data:
+            diff.add('read')
+            color_id = int(row['id'])
+            new_values = (row['name'], row['rgb'], rebrickable_csv.parse_bool(row['is_trans']))
+
+            old_values = existing_colors.get(color_id)
+            if old_values is None:
+                diff.add('inserted', F'{color_id}: {new_values}')
+            elif old_values != new_values:
+                diff.add('updated', F'{color_id}: {old_values} -> {new_values}')
+            else:
+                diff.add('skipped')
+
+        return diff
+
+    def diff_part_categories(self, csv_data):
+        diff = ImportDiff('Part Categories')
+        existing_categories = dict(PartCategory.objects.values_list('id', 'name'))
+
+        for row in csv_data:
+            diff.add('read')
+            category_id = int(row['id'])
+            name = row['name']
+
+            if category_id not in existing_categories:
+                self.new_category_ids.add(category_id)
+                diff.add('inserted', F'{category_id}: {name}')
+            elif existing_categories[category_id] != name:
+                diff.add('updated', F'{category_id}: "{existing_categories[category_id]}" -> "{name}"')
+            else:
+                diff.add('skipped')
+
+        return diff
+
+    def diff_parts(self, csv_data):
+        diff = ImportDiff('Parts')
+        existing_parts = {part_num: (name, category_id) for part_num, name, category_id
+                          in Part.objects.values_list('part_num', 'name', 'category_id')}
+        category_ids = set(PartCategory.objects.values_list('id', flat=True)) | self.new_category_ids
+
+        for row in csv_data:
+            diff.add('read')
+            part_num = row['part_num']
+            new_values = (row['name'], int(row['part_cat_id']))
+
+            if new_values[1] not in category_ids:
+                diff.add('skipped')
+                continue
+
+            old_values = existing_parts.get(part_num)
+            if old_values is None:
+                self.new_part_nums.add(part_num)
+                diff.add('inserted', F'{part_num}: {new_values}')
+            elif old_values != new_values:
+                diff.add('updated', F'{part_num}: {old_values} -> {new_values}')
+            else:
+                diff.add('skipped')
+
+        return diff
+
+    def diff_relationships(self, csv_data):
+        diff = ImportDiff('Relationships')
+        part_nums = set(Part.objects.values_list('part_num', flat=True)) | self.new_part_nums
+        existing_relationships = {
+            (child, parent): rel_type for child, parent, rel_type in PartRelationship.objects.values_list(
+                'child_part__part_num', 'parent_part__part_num', 'relationship_type')}
+        csv_keys = set()
+
+        for row in csv_data:
+            diff.add('read')
+            key = (row['child_part_num'], row['parent_part_num'])
+            rel_type = PartRelationship.rebrickable_types[row['rel_type']]
+
+            if (key[0] not in part_nums) or (key[1] not in part_nums):
+                diff.add('skipped')
+                continue
+
+            csv_keys.add(key)
+            old_rel_type = existing_relationships.get(key)
+            if old_rel_type is None:
+                diff.add('inserted', F'{key[1]} => {rel_type} => {key[0]}')
+            elif old_rel_type != rel_type:
+                diff.add('updated', F'{key[1]} => {old_rel_type} -> {rel_type} => {key[0]}')
+            else:
+                diff.add('skipped')
+
+        # Whatever was not in the csv would be deleted
+        for (child, parent), rel_type in existing_relationships.items():
+            if (child, parent) not in csv_keys:
+                diff.add('deleted', F'{parent} => {rel_type} => {child}')
+
+        return diff
+
+    def diff_set_parts(self, open_csv, *, partition_rows=DRY_RUN_PARTITION_ROWS):
+        # Only one partition of the existing rows is held in memory, the csv is streamed once per partition
+        diff = ImportDiff('Set Parts')
+        part_nums = set(Part.objects.values_list('part_num', flat=True)) | self.new_part_nums
+        partitions = max(1, math.ceil(SetPart.objects.count() / partition_rows))
+
+        for partition in range(partitions):
+            logger.info(F'  Dry Run - Set Parts partition {partition + 1}/{partitions}')
+            existing_set_parts = self._existing_set_parts(partition, partitions)
+
+            with open_csv() as csv_file:
+                # Count read and invalid rows once only
+                set_part_rows = self._valid_set_part_rows(diff, csv_file, part_nums, count_rows=partition == 0)
+                self._diff_set_part_rows(
+                    diff, existing_set_parts, (row for row in set_part_rows if (row[0] % partitions) == partition))
+
+        return diff
+
+    @staticmethod
+    def _existing_set_parts(partition, partitions):
+        return {
+            (set_inventory, part_num, color_id, is_spare): qty
+            for set_inventory, part_num, color_id, is_spare, qty in SetPart.objects.annotate(
+                partition=Mod(F('set_inventory'), partitions)).filter(partition=partition).values_list(
+                    'set_inventory', 'part__part_num', 'color_id', 'is_spare', 'qty').iterator()
+        }
+
+    @staticmethod
+    def _valid_set_part_rows(diff, csv_file, part_nums, *, count_rows):
+        for row in csv.DictReader(csv_file):
+            set_part_row = rebrickable_csv.parse_inventory_part_row(row)
+            valid = (set_part_row is not None) and (set_part_row[1] in part_nums)
+
+            if count_rows:
+                diff.add('read')
+                if not valid:
+                    diff.add('skipped')
+
+            if valid:
+                yield set_part_row
+
+    @staticmethod
+    def _diff_set_part_rows(diff, existing_set_parts, set_part_rows):
+        for set_inventory, part_num, color_id, qty, is_spare in set_part_rows:
+            key = (set_inventory, part_num, color_id, is_spare)
+            old_qty = existing_set_parts.pop(key, None)
+            if old_qty is None:
+                diff.add('inserted', F'{key}: qty {qty}')
+            elif old_qty != qty:
+                diff.add('updated', F'{key}: qty {old_qty} -> {qty}')
+            else:
+                diff.add('skipped')
+
+        # Whatever was not in the csv would be deleted
+        for key, qty in existing_set_parts.items():
+            diff.add('deleted', F'{key}: qty {qty}')
@@ -0,0 +1,237 @@
+import logging
+import sqlite3
+
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from inventory.models import Color, PartCategory, Part, PartRelationship
+from inventory.part_families import update_part_families
+from utils import rebrickable_csv
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+STAGING_BATCH_SIZE = 5000
+
+
+def check_backend_supported():
+    # INSERT ... ON CONFLICT DO UPDATE is available in PostgreSQL 9.5+ and SQLite 3.24+
+    if connection.vendor == 'sqlite':
+        if sqlite3.sqlite_version_info < (3, 24):
+            raise ValueError(F'SQLite {sqlite3.sqlite_version} does not support ON CONFLICT, 3.24 is required')
+    elif connection.vendor != 'postgresql':
+        raise ValueError(F'Database "{connection.vendor}" is not supported for the sql import backend')
+
+
+def merge_colors(csv_data):
+    logger.info('Merge Colors')
+    rows = [(int(row['id']), row['name'], row['rgb'], rebrickable_csv.parse_bool(row['is_trans']))
+            for row in csv_data]
+
+    # The sort fields are normally set by Color.save(), calculate them for the whole palette
+    color_steps = Color.color_steps([Color.rgb_to_ints(rgb) for _, _, rgb, _ in rows])
+    staging_rows = [row + hlv for row, hlv in zip(rows, color_steps)]
+
+    return _merge_by_key(
+        Color, staging_rows,
+        ['id', 'name', 'rgb', 'transparent', 'color_step_hue', 'color_step_lumination', 'color_step_value'],
+        key_columns=['id'])
+
+
+def merge_part_categories(csv_data):
+    logger.info('Merge Part Categories')
+    staging_rows = [(int(row['id']), row['name']) for row in csv_data]
+    return _merge_by_key(PartCategory, staging_rows, ['id', 'name'], key_columns=['id'])
+
+
+def merge_parts(csv_data):
+    logger.info('Merge Parts')
+    categories = PartCategory.objects.in_bulk()
+
+    staging_rows = []
+    import_stats = defaultdict(int)
+    for row in csv_data:
+        import_stats['read'] += 1
+        category = categories.get(int(row['part_cat_id']))
+        if category is None:
+            logger.warning(F'  Unknown Category "{row["part_cat_id"]}" for Part "{row["part_num"]}"')
+            import_stats['skipped'] += 1
+            continue
+
+        # Height from the category as Part.normalize_dimensions() would set it, new parts are not dirty
+        staging_rows.append((row['part_num'], row['name'], category.id, category.height, False))
+
+    # Like the orm import, a changed part is only dirty for set_related_attributes if its height changes.
+    # The SET expressions see the row before the update, NULL keeps the current height
+    qn = connection.ops.quote_name  # pylint: disable=invalid-name
+    height = F'{qn(Part._meta.db_table)}.{qn(Part._meta.get_field("height").column)}'
+    new_height = F'excluded.{qn(Part._meta.get_field("height").column)}'
+    dirty = F'{qn(Part._meta.db_table)}.{qn(Part._meta.get_field("attributes_dirty").column)}'
+    update_expressions = {
+        'height': F'COALESCE({new_height}, {height})',
+        'attributes_dirty': F'({dirty} OR ({new_height} IS NOT NULL AND {_is_distinct(height, new_height)}))',
+    }
+
+    merge_stats = _merge_by_key(
+        Part, staging_rows, ['part_num', 'name', 'category', 'height', 'attributes_dirty'],
+        key_columns=['part_num'], update_expressions=update_expressions)
+
+    import_stats['inserted'] = merge_stats['inserted']
+    import_stats['updated'] = merge_stats['updated']
+    import_stats['skipped'] += merge_stats['skipped']
+    return import_stats
+
+
+def merge_relationships(csv_data):
+    logger.info('Merge Relationships')
+    import_stats = defaultdict(int)
+
+    # A pair can only be merged once per statement, the last row wins
+    relationships = {}
+    for row in csv_data:
+        import_stats['read'] += 1
+        relationship_type = PartRelationship.rebrickable_types[row['rel_type']]
+        relationships[(row['child_part_num'], row['parent_part_num'])] = relationship_type
+    staging_rows = [(child, parent, rel_type) for (child, parent), rel_type in relationships.items()]
+
+    qn = connection.ops.quote_name  # pylint: disable=invalid-name
+    target = qn(PartRelationship._meta.db_table)
+    part_table = qn(Part._meta.db_table)
+    staging = qn('staging_partrelationship')
+
+    staging_columns = [
+        ('child_part_num', Part._meta.get_field('part_num')),
+        ('parent_part_num', Part._meta.get_field('part_num')),
+        ('relationship_type', PartRelationship._meta.get_field('relationship_type')),
+    ]
+
+    # Resolve the part_nums in the database, rows with unknown parts drop out of the join
+    resolved_select = F'''
+        SELECT child.id AS child_part_id, parent.id AS parent_part_id, s.relationship_type
+        FROM {staging} s
+        JOIN {part_table} child ON child.part_num = s.child_part_num
+        JOIN {part_table} parent ON parent.part_num = s.parent_part_num'''
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        _load_staging_table(cursor, staging, staging_columns, staging_rows)
+
+        import_stats['inserted'] = _count(cursor, F'''
+            SELECT COUNT(*) FROM ({resolved_select}) r
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {target} t
+                WHERE t.child_part_id = r.child_part_id AND t.parent_part_id = r.parent_part_id)''')
+        import_stats['updated'] = _count(cursor, F'''
+            SELECT COUNT(*) FROM ({resolved_select}) r
+            JOIN {target} t ON t.child_part_id = r.child_part_id AND t.parent_part_id = r.parent_part_id
+            WHERE t.relationship_type <> r.relationship_type''')
+
+        # Relationships no longer in the file are removed
+        not_in_file = F'''
+            NOT EXISTS (
+                SELECT 1 FROM ({resolved_select}) r
+                WHERE r.child_part_id = {target}.child_part_id AND r.parent_part_id = {target}.parent_part_id)'''
+        import_stats['deleted'] = _count(cursor, F'SELECT COUNT(*) FROM {target} WHERE {not_in_file}')
+        cursor.execute(F'DELETE FROM {target} WHERE {not_in_file}')
+
+        cursor.execute(F'''
+            INSERT INTO {target} (child_part_id, parent_part_id, relationship_type)
+            SELECT child_part_id, parent_part_id, relationship_type FROM ({resolved_select}) r
+            WHERE true
+            ON CONFLICT (child_part_id, parent_part_id) DO UPDATE
+            SET relationship_type = excluded.relationship_type
+            WHERE {target}.relationship_type <> excluded.relationship_type''')
+
+        cursor.execute(F'DROP TABLE {staging}')
+
+        # The inserted and deleted pairs are not known here, recalculate all families
+        if import_stats['inserted'] or import_stats['deleted']:
+            update_part_families()
+
+    import_stats['skipped'] = import_stats['read'] - import_stats['inserted'] - import_stats['updated']
+    _log_merge_stats(import_stats)
+    return import_stats
+
+
+def _merge_by_key(model, staging_rows, columns, *, key_columns, update_expressions=None):
+    # pylint: disable=too-many-locals
+    # Load the rows into a temporary staging table, the database then joins and upserts them in one statement.
+    # update_expressions replace the plain "column = excluded.column" update, these columns are not compared
+    import_stats = defaultdict(int)
+    import_stats['read'] = len(staging_rows)
+
+    update_expressions = update_expressions or {}
+    compare_columns = [c for c in columns if (c not in key_columns) and (c not in update_expressions)]
+
+    qn = connection.ops.quote_name  # pylint: disable=invalid-name
+    target = qn(model._meta.db_table)
+    staging = qn(F'staging_{model._meta.model_name}')
+
+    fields = [model._meta.get_field(column) for column in columns]
+    db_columns = [qn(field.column) for field in fields]
+    db_keys = [qn(model._meta.get_field(column).column) for column in key_columns]
+    db_compare = [qn(model._meta.get_field(column).column) for column in compare_columns]
+
+    key_join = ' AND '.join(F't.{key} = s.{key}' for key in db_keys)
+    changed = ' OR '.join(_is_distinct(F't.{column}', F's.{column}') for column in db_compare)
+    changed_excluded = ' OR '.join(
+        _is_distinct(F'{target}.{column}', F'excluded.{column}') for column in db_compare)
+
+    update_set = []
+    for field, column in zip(fields, db_columns):
+        if field.name in key_columns:
+            continue
+        if field.name in update_expressions:
+            update_set.append(F'{column} = {update_expressions[field.name]}')
+        else:
+            update_set.append(F'{column} = excluded.{column}')
+
+    column_list = ', '.join(db_columns)
+    with transaction.atomic(), connection.cursor() as cursor:
+        _load_staging_table(cursor, staging, list(zip(db_columns, fields)), staging_rows)
+
+        import_stats['inserted'] = _count(cursor, F'''
+            SELECT COUNT(*) FROM {staging} s WHERE NOT EXISTS (SELECT 1 FROM {target} t WHERE {key_join})''')
+        import_stats['updated'] = _count(cursor, F'''
+            SELECT COUNT(*) FROM {staging} s JOIN {target} t ON {key_join} WHERE {changed}''')
+
+        cursor.execute(F'''
+            INSERT INTO {target} ({column_list})
+            SELECT {column_list} FROM {staging}
+            WHERE true
+            ON CONFLICT ({', '.join(db_keys)}) DO UPDATE
+            SET {', '.join(update_set)}
+            WHERE {changed_excluded}''')
+
+        cursor.execute(F'DROP TABLE {staging}')
+
+    import_stats['skipped'] = import_stats['read'] - import_stats['inserted'] - import_stats['updated']
+    _log_merge_stats(import_stats)
+    return import_stats
+
+
+def _load_staging_table(cursor, staging, columns, rows):
+    # columns are (column name, model field), the field provides the column type and value conversion
+    column_defs = ', '.join(F'{column} {field.db_type(connection)}' for column, field in columns)
+    cursor.execute(F'CREATE TEMPORARY TABLE {staging} ({column_defs})')
+
+    insert_sql = F'''INSERT INTO {staging} ({', '.join(c for c, _ in columns)})
+                     VALUES ({', '.join(['%s'] * len(columns))})'''
+    for idx in range(0, len(rows), STAGING_BATCH_SIZE):
+        cursor.executemany(insert_sql, [
+            [field.get_db_prep_save(value, connection) for (_, field), value in zip(columns, row)]
+            for row in rows[idx:idx + STAGING_BATCH_SIZE]])
+
+
+def _count(cursor, sql):
+    cursor.execute(sql)
+    return cursor.fetchone()[0]
+
+
+def _is_distinct(left, right):
+    # Portable "IS DISTINCT FROM", NULL compares equal to NULL
+    return F'(NOT ({left} = {right} OR ({left} IS NULL AND {right} IS NULL)))'
+
+
+def _log_merge_stats(import_stats):
+    logger.info(F'  Inserted: {import_stats["inserted"]}, Updated: {import_stats["updated"]}, '
+                F'Deleted: {import_stats["deleted"]}, Skipped: {import_stats["skipped"]}')
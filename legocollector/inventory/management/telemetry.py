@@ -0,0 +1,129 @@
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # pylint: disable=invalid-name
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+STAGE_COUNTERS = ['read', 'inserted', 'updated', 'deleted', 'skipped']
+
+
+def max_rss_kb():
+    # Peak resident set size of this process so far, not available on Windows
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss //= 1024  # Reported in bytes on macOS
+    return max_rss
+
+
+class ImportReport():
+
+    def __init__(self, command_name):
+        self.command_name = command_name
+        self.started = datetime.datetime.now()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        # Callers add their counts to the yielded dictionary, e.g. stage_stats.update(import_stats)
+        stage_stats = defaultdict(int)
+        query_count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        start_time = time.perf_counter()
+        status = 'failed'
+        try:
+            with connection.execute_wrapper(count_queries):
+                yield stage_stats
+            status = 'done'
+        finally:
+            duration = time.perf_counter() - start_time
+            stage_report = {
+                'name': name,
+                'status': status,
+                'duration_sec': round(duration, 3),
+                'queries': query_count,
+                'max_rss_kb': max_rss_kb(),
+            }
+            for counter in STAGE_COUNTERS:
+                stage_report[F'rows_{counter}'] = stage_stats[counter]
+            stage_report['rows_per_sec'] = round(stage_stats['read'] / duration, 1) if duration else None
+            self.stages.append(stage_report)
+
+    def skip_stage(self, name, reason):
+        self.stages.append({'name': name, 'status': 'skipped', 'reason': reason})
+
+    def as_dict(self):
+        return {
+            'command': self.command_name,
+            'started': self.started.isoformat(timespec='seconds'),
+            'duration_sec': round((datetime.datetime.now() - self.started).total_seconds(), 3),
+            'max_rss_kb': max_rss_kb(),
+            'stages': self.stages,
+        }
+
+    def write(self, report_path):
+        report_dir = os.path.dirname(report_path)
+        if report_dir and not os.path.exists(report_dir):
+            os.makedirs(report_dir)
+
+        with open(report_path, 'w', encoding='utf-8') as file_ptr:
+            json.dump(self.as_dict(), file_ptr, indent=2)
+
+
+class ReportCommand(BaseCommand):
+    # Base for the import commands, records per stage telemetry in self.report and writes it at exit
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.report = None
+
+    @property
+    def command_name(self):
+        return self.__module__.rsplit('.', 1)[-1]
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--report-path', type=str,
+            help='Json file to write the run report to, defaults to a file in settings.IMPORT_REPORT_DIR')
+        return parser
+
+    def execute(self, *args, **options):
+        self.report = ImportReport(self.command_name)
+        try:
+            return super().execute(*args, **options)
+        finally:
+            self._write_report(options.get('report_path'))
+
+    def _write_report(self, report_path):
+        logger.info(F'Run Report: {json.dumps(self.report.as_dict())}')
+
+        if not report_path and getattr(settings, 'IMPORT_REPORT_DIR', None):
+            file_name = F'{self.command_name}_{self.report.started:%Y%m%d_%H%M%S}.json'
+            report_path = os.path.join(settings.IMPORT_REPORT_DIR, file_name)
+
+        if report_path:
+            self.report.write(report_path)
+            logger.info(F'Run Report written to "{report_path}"')
@@ -0,0 +1,31 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0031_auto_20191129_1718'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='partcategory',
+            options={'ordering': ('name',)},
+        ),
+        migrations.CreateModel(
+            name='ImportFileState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=32)),
+                ('name', models.CharField(max_length=100)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('imported', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('source', 'name')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0032_auto_20261018_1748'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='scraped_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
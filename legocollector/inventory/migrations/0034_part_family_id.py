@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0033_part_scraped_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='family_id',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
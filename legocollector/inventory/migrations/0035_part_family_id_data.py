@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from utils.union_find import UnionFind
+
+
+def set_part_families(apps, schema_editor):  # pylint: disable=unused-argument
+    Part = apps.get_model('inventory', 'Part')  # pylint: disable=invalid-name
+    PartRelationship = apps.get_model('inventory', 'PartRelationship')  # pylint: disable=invalid-name
+
+    part_sets = UnionFind()
+    for child_part_id, parent_part_id in PartRelationship.objects.values_list('child_part_id', 'parent_part_id'):
+        part_sets.union(child_part_id, parent_part_id)
+
+    parts = []
+    for family in part_sets.groups():
+        family_id = min(family)
+        parts += [Part(id=part_id, family_id=family_id) for part_id in family]
+    Part.objects.bulk_update(parts, ['family_id'], batch_size=999)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0034_part_family_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_part_families, migrations.RunPython.noop),
+    ]
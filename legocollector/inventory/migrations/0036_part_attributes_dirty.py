@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0035_part_family_id_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='attributes_dirty',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+    ]
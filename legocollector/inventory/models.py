@@ -1,11 +1,52 @@
 import colorsys
 import math
 
-from django.db import models
+from decimal import Decimal
+
+from django.db import connection, models
 from django.db.models import Sum
 from django.contrib.auth.models import User
 from django.urls import reverse
 
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # pylint: disable=invalid-name
+
+
+def _numpy_hue_value(rgb):
+    # Equivalent of colorsys.rgb_to_hsv() for an array of rgb rows, without the saturation
+    red, green, blue = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    maxc = rgb.max(axis=1)
+    rangec = maxc - rgb.min(axis=1)
+    grey = rangec == 0
+    safe_range = numpy.where(grey, 1.0, rangec)
+    redc = (maxc - red) / safe_range
+    greenc = (maxc - green) / safe_range
+    bluec = (maxc - blue) / safe_range
+    hue = numpy.where(
+        red == maxc, bluec - greenc,
+        numpy.where(green == maxc, 2.0 + redc - bluec, 4.0 + greenc - redc))
+    hue = numpy.where(grey, 0.0, numpy.mod(hue / 6.0, 1.0))
+    return (hue, maxc)
+
+
+def _numpy_color_steps(rgb_ints_list, repetitions):
+    # Vectorized Color.color_step() for a whole palette
+    rgb = numpy.array(rgb_ints_list, dtype=numpy.float64)
+    lum = numpy.sqrt(.241 * rgb[:, 0] + .691 * rgb[:, 1] + .068 * rgb[:, 2])
+    hue, value = _numpy_hue_value(rgb)
+
+    hue2 = (hue * repetitions).astype(numpy.int64)
+    value2 = (value * repetitions).astype(numpy.int64)
+
+    odd_hue = (hue2 % 2) == 1
+    value2 = numpy.where(odd_hue, repetitions - value2, value2)
+    lum = numpy.where(odd_hue, repetitions - lum, lum)
+
+    return [(int(hue_step), float(lum_step), int(value_step))
+            for hue_step, lum_step, value_step in zip(hue2, lum, value2)]
+
 
 class PartCategory(models.Model):
     id = models.IntegerField(primary_key=True, editable=False)
@@ -42,7 +83,11 @@ class Color(models.Model):
 
     @property
     def rgb_ints(self):
-        return (int(self.rgb[:2], 16), int(self.rgb[2:4], 16), int(self.rgb[4:], 16))
+        return self.rgb_to_ints(self.rgb)
+
+    @staticmethod
+    def rgb_to_ints(rgb):
+        return (int(rgb[:2], 16), int(rgb[2:4], 16), int(rgb[4:], 16))
 
     @property
     def complimentary_color(self):
@@ -72,17 +117,36 @@ class Color(models.Model):
 
         return (hue2, lum, value2)
 
-    def save(self, *args, **kwargs):  # pylint: disable=signature-differs
-        hlv = self.color_step(self.rgb_ints[0], self.rgb_ints[1], self.rgb_ints[2])
+    @staticmethod
+    def color_steps(rgb_ints_list, repetitions=8, *, use_numpy=True):
+        # Same as color_step() for a whole palette, vectorized if numpy is available
+        if not rgb_ints_list:
+            return []
+
+        if not use_numpy or numpy is None:
+            return [Color.color_step(red, green, blue, repetitions) for red, green, blue in rgb_ints_list]
+
+        return _numpy_color_steps(rgb_ints_list, repetitions)
+
+    def set_color_steps(self, hlv=None):
+        # bulk_create and bulk_update don't call save(), they can pass precomputed steps
+        if hlv is None:
+            hlv = self.color_step(*self.rgb_ints)
         self.color_step_hue = hlv[0]
         self.color_step_lumination = hlv[1]
         self.color_step_value = hlv[2]
+
+    def save(self, *args, **kwargs):  # pylint: disable=signature-differs
+        self.set_color_steps()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
+DIMENSION_QUANTUM = Decimal('0.0001')  # decimal_places of the Part dimension fields
+
+
 class Part(models.Model):
     part_num = models.CharField(unique=True, max_length=20)
     name = models.CharField(max_length=250)
@@ -93,10 +157,24 @@ class Part(models.Model):
     bottom_studs = models.PositiveIntegerField(blank=True, null=True)
     stud_rings = models.PositiveIntegerField(blank=True, null=True)
     image_url = models.CharField(max_length=250, blank=True, null=True)
+    # Hash of the last imported scraped record, unchanged records are skipped on import
+    scraped_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
+    # Lowest part id of all parts connected through relationships, None without relationships.
+    # Maintained by inventory.part_families when relationships are imported, saved or deleted.
+    family_id = models.IntegerField(blank=True, null=True, db_index=True, editable=False)
+    # Set by the importers when attributes shared within a family change, set_related_attributes --incremental
+    # only processes the families of dirty parts
+    attributes_dirty = models.BooleanField(default=False, db_index=True, editable=False)
 
     category = models.ForeignKey(PartCategory, on_delete=models.CASCADE, related_name='parts')
 
     def save(self, *args, **kwargs):  # pylint: disable=signature-differs
+        self.normalize_dimensions()
+        super().save(*args, **kwargs)
+
+    def normalize_dimensions(self):
+        # Called by save(), bulk_create and bulk_update need to call it explicitly
+
         # Ensure length cannot be smaller than width
         if self.length is not None and self.width is not None:
             if self.width > self.length:
@@ -108,11 +186,16 @@ class Part(models.Model):
         if self.category and self.category.height:
             self.height = self.category.height
 
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return F'{self.name} ({self.part_num})'
 
+    @property
+    def stored_dimensions(self):
+        # (width, length, height) rounded as the database stores them, normalize_dimensions() can set a float
+        # height that never equals the Decimal read back
+        return tuple(None if value is None else Decimal(str(value)).quantize(DIMENSION_QUANTUM)
+                     for value in (self.width, self.length, self.height))
+
     @property
     def dimension_set_count(self):
         return [self.width is not None, self.height is not None, self.length is not None].count(True)
@@ -142,33 +225,75 @@ class Part(models.Model):
     def set_count(self):
         return len(self.set_inventories)
 
-    def get_related_parts(self, *, parents, children, transitive, parts_processed=None):
-        related_parts = []
-
-        if not parts_processed:
-            parts_processed = []
-
-        my_related_parts = []
+    @property
+    def family_members(self):
+        # This part and all parts related to it through any chain of relationships
+        if self.family_id is None:
+            return Part.objects.filter(pk=self.pk)
+        return Part.objects.filter(family_id=self.family_id)
+
+    def get_related_parts(self, *, parents, children, transitive, relationship_type=None):
+        if not transitive:
+            relationships = PartRelationship.objects.select_related('parent_part', 'child_part')
+            if relationship_type is not None:
+                relationships = relationships.filter(relationship_type=relationship_type)
+
+            related_parts = []
+            if parents:
+                related_parts += [r.parent_part for r in relationships.filter(child_part=self)]
+            if children:
+                related_parts += [r.child_part for r in relationships.filter(parent_part=self)]
+            return related_parts
+
+        if not (parents or children):
+            return []
+
+        cte_sql, params = self._related_parts_cte(
+            parents=parents, children=children, relationship_type=relationship_type)
+        part_table = connection.ops.quote_name(Part._meta.db_table)
+        return list(Part.objects.raw(
+            F'''{cte_sql}
+                SELECT * FROM {part_table}
+                WHERE id IN (SELECT part_id FROM related) AND id <> %s
+                ORDER BY id''', params + [self.id]))
+
+    def related_part_count(self, *, parents, children, transitive, relationship_type=None):
+        if not (transitive and (parents or children)):
+            return len(self.get_related_parts(
+                parents=parents, children=children, transitive=transitive, relationship_type=relationship_type))
+
+        cte_sql, params = self._related_parts_cte(
+            parents=parents, children=children, relationship_type=relationship_type)
+        with connection.cursor() as cursor:
+            cursor.execute(F'{cte_sql} SELECT COUNT(*) FROM related WHERE part_id <> %s', params + [self.id])
+            return cursor.fetchone()[0]
+
+    def _related_parts_cte(self, *, parents, children, relationship_type):
+        # "related" holds this part and every part reachable through relationships in the given directions.
+        # UNION drops the rows already found, so relationship cycles terminate. Works on Sqlite and PostgreSQL.
+        qn = connection.ops.quote_name  # pylint: disable=invalid-name
+        relationship_table = qn(PartRelationship._meta.db_table)
+        type_filter = ' WHERE relationship_type = %s' if relationship_type is not None else ''
+
+        # Edges as (from_id, to_id), a parent is reached from its child and a child from its parent
+        edge_selects = []
+        params = []
         if parents:
-            my_related_parts += [r.parent_part for r in PartRelationship.objects.filter(child_part=self)]
+            edge_selects.append(
+                F'SELECT child_part_id AS from_id, parent_part_id AS to_id FROM {relationship_table}{type_filter}')
+            params += [relationship_type] if relationship_type is not None else []
         if children:
-            my_related_parts += [r.child_part for r in PartRelationship.objects.filter(parent_part=self)]
-
-        if transitive:
-            parts_processed.append(self.part_num)
-            for part in my_related_parts:
-                if part.part_num not in parts_processed:
-                    related_parts.append(part)
-                    related_parts += part.get_related_parts(
-                        parents=parents, children=children, transitive=transitive,
-                        parts_processed=parts_processed)
-        else:
-            related_parts = my_related_parts
+            edge_selects.append(
+                F'SELECT parent_part_id AS from_id, child_part_id AS to_id FROM {relationship_table}{type_filter}')
+            params += [relationship_type] if relationship_type is not None else []
 
-        return related_parts
-
-    def related_part_count(self, *, parents, children, transitive):
-        return len(self.get_related_parts(parents=parents, children=children, transitive=transitive))
+        cte_sql = F'''WITH RECURSIVE related(part_id) AS (
+                SELECT CAST(%s AS INTEGER)
+                UNION
+                SELECT edges.to_id FROM related
+                JOIN ({' UNION ALL '.join(edge_selects)}) edges ON edges.from_id = related.part_id
+            )'''
+        return (cte_sql, [self.id] + params)
 
 
 class PartRelationship(models.Model):
@@ -187,6 +312,13 @@ class PartRelationship(models.Model):
         (DIFFERENT_PRINT, 'Print'),
         (DIFFERENT_PATTERN, 'Pattern'),
     ]
+    # rel_type codes of the Rebrickable part_relationships.csv
+    rebrickable_types = {
+        'A': ALTERNATE_PART,
+        'M': DIFFERENT_MOLD,
+        'P': DIFFERENT_PRINT,
+        'T': DIFFERENT_PATTERN
+    }
     relationship_type = models.CharField(max_length=32, choices=type_choices)
 
     class Meta:
@@ -284,3 +416,22 @@ class SetPart(models.Model):
 
     def __str__(self):
         return F'{self.part} - {self.qty} x {self.color}'
+
+
+class ImportFileState(models.Model):
+    # Remembers the last successfully imported content of a source file, so unchanged files can be skipped
+    source = models.CharField(max_length=32)
+    name = models.CharField(max_length=100)
+    content_hash = models.CharField(max_length=64)
+    row_count = models.PositiveIntegerField(default=0)
+    imported = models.DateTimeField(auto_now=True)
+
+    # pylint: disable=invalid-name
+    REBRICKABLE = 'Rebrickable'
+    # pylint: enable=invalid-name
+
+    class Meta:
+        unique_together = (('source', 'name'),)
+
+    def __str__(self):
+        return F'{self.source} - {self.name} ({self.row_count} rows)'
@@ -0,0 +1,82 @@
+import logging
+import threading
+
+from contextlib import contextmanager
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from inventory.models import Part, PartRelationship
+from utils.chunks import chunks
+from utils.union_find import UnionFind
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+BULK_BATCH_SIZE = 999  # Max for Sqlite3
+INCREMENTAL_PART_LIMIT = 500
+
+_deferred = threading.local()
+
+
+def update_part_families(part_ids=None):
+    # Recalculate Part.family_id for the families of part_ids, all families if None.
+    # part_ids need to include both parts of every relationship added or removed since the last update.
+    # Returns the number of parts whose family changed.
+    if (part_ids is not None) and (len(part_ids) > INCREMENTAL_PART_LIMIT):
+        part_ids = None
+
+    if part_ids is None:
+        relationships = PartRelationship.objects.values_list('child_part_id', 'parent_part_id')
+        current_family_ids = dict(Part.objects.filter(family_id__isnull=False).values_list('id', 'family_id'))
+    else:
+        # The old families of the parts contain every relationship that can reach them
+        family_ids = set(Part.objects.filter(
+            id__in=part_ids, family_id__isnull=False).values_list('family_id', flat=True))
+        affected_part_ids = set(part_ids) | set(Part.objects.filter(
+            family_id__in=family_ids).values_list('id', flat=True))
+
+        relationships = []
+        for chunk in chunks(affected_part_ids, BULK_BATCH_SIZE):
+            relationships += PartRelationship.objects.filter(
+                child_part_id__in=chunk).values_list('child_part_id', 'parent_part_id')
+        current_family_ids = {}
+        for chunk in chunks(affected_part_ids, BULK_BATCH_SIZE):
+            current_family_ids.update(Part.objects.filter(id__in=chunk).values_list('id', 'family_id'))
+
+    part_sets = UnionFind()
+    for child_part_id, parent_part_id in relationships:
+        part_sets.union(child_part_id, parent_part_id)
+
+    new_family_ids = {}
+    for family in part_sets.groups():
+        family_id = min(family)
+        for part_id in family:
+            new_family_ids[part_id] = family_id
+
+    # Parts in no family anymore have their family_id cleared, a changed family needs its attributes propagated
+    changed_parts = [
+        Part(id=part_id, family_id=new_family_ids.get(part_id), attributes_dirty=True)
+        for part_id in set(current_family_ids) | set(new_family_ids)
+        if current_family_ids.get(part_id) != new_family_ids.get(part_id)]
+    Part.objects.bulk_update(changed_parts, ['family_id', 'attributes_dirty'], batch_size=BULK_BATCH_SIZE)
+
+    logger.info(F'  Part Families Updated on {len(changed_parts)} Parts')
+    return len(changed_parts)
+
+
+@contextmanager
+def deferred_family_updates():
+    # Relationships saved or deleted inside don't update the families one by one,
+    # the caller calls update_part_families() once for all of them
+    _deferred.depth = getattr(_deferred, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _deferred.depth -= 1
+
+
+@receiver([post_save, post_delete], sender=PartRelationship)
+def relationship_changed(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    # Keeps family_id current for relationships changed outside the importers, e.g. in the admin
+    if getattr(_deferred, 'depth', 0):
+        return
+    update_part_families({instance.child_part_id, instance.parent_part_id})
@@ -0,0 +1,48 @@
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from inventory.models import Part, PartCategory
+from inventory.management.commands.guess_dimensions_from_part_names import Command
+
+
+class TestGuessDimensions(TestCase):
+
+    def setUp(self):
+        bricks = PartCategory.objects.create(id=1, name='Bricks')
+        plates = PartCategory.objects.create(id=2, name='Plates')
+        Part.objects.create(part_num='brick', name='Brick 4 x 2 x 3', category=bricks)
+        Part.objects.create(part_num='plate', name='Plate 1 x 6', category=plates)
+        Part.objects.create(part_num='head', name='Minifig Head', category=bricks)
+        Part.objects.create(part_num='known', name='Brick 2 x 2', category=bricks, width=1)
+        # save() sets the category height, clear it as a part without any dimension
+        Part.objects.filter(part_num='plate').update(height=None)
+
+    def assert_guessed(self):
+        brick = Part.objects.get(part_num='brick')
+        self.assertEqual((brick.width, brick.length, brick.height), (Decimal(2), Decimal(4), Decimal(3)))
+        self.assertTrue(brick.attributes_dirty)
+
+        # Height from the category
+        plate = Part.objects.get(part_num='plate')
+        self.assertEqual((plate.width, plate.length, plate.height), (Decimal(1), Decimal(6), Decimal('0.33')))
+
+        self.assertIsNone(Part.objects.get(part_num='head').width)
+        known = Part.objects.get(part_num='known')
+        self.assertEqual((known.width, known.length), (Decimal(1), None))
+        self.assertFalse(known.attributes_dirty)
+
+    def test_guess_dimensions(self):
+        # Candidates, categories and one bulk update inside the savepoint
+        with self.assertNumQueries(5):
+            import_stats = Command().guess_dimensions()
+
+        self.assertEqual(import_stats['read'], 3)
+        self.assertEqual(import_stats['updated'], 2)
+        self.assertEqual(import_stats['skipped'], 1)
+        self.assert_guessed()
+
+    def test_guess_dimensions_workers(self):
+        call_command('guess_dimensions_from_part_names', '--workers', '2')
+        self.assert_guessed()
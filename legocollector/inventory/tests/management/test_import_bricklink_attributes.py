@@ -0,0 +1,98 @@
+import os
+import tempfile
+
+from decimal import Decimal
+
+from django.test import TestCase
+
+from inventory.models import Part, PartCategory, PartExternalId
+from inventory.management.commands.import_bricklink_attributes import Command
+
+
+PARTS_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<CATALOG>
+<ITEM><ITEMTYPE>P</ITEMTYPE><ITEMID>part1</ITEMID><ITEMDIMX>2</ITEMDIMX><ITEMDIMY>4</ITEMDIMY><ITEMDIMZ>1</ITEMDIMZ></ITEM>
+<ITEM><ITEMTYPE>P</ITEMTYPE><ITEMID>bl_part2</ITEMID><ITEMDIMX>3</ITEMDIMX><ITEMDIMY>1</ITEMDIMY><ITEMDIMZ></ITEMDIMZ></ITEM>
+<ITEM><ITEMTYPE>P</ITEMTYPE><ITEMID>part3</ITEMID><ITEMDIMX></ITEMDIMX><ITEMDIMY></ITEMDIMY><ITEMDIMZ></ITEMDIMZ></ITEM>
+<ITEM><ITEMTYPE>P</ITEMTYPE><ITEMID>part4</ITEMID><ITEMDIMX>10</ITEMDIMX><ITEMDIMY>9</ITEMDIMY><ITEMDIMZ>1</ITEMDIMZ></ITEM>
+<ITEM><ITEMTYPE>P</ITEMTYPE><ITEMID>plate1</ITEMID><ITEMDIMX>1</ITEMDIMX><ITEMDIMY>2</ITEMDIMY><ITEMDIMZ></ITEMDIMZ></ITEM>
+<ITEM><ITEMTYPE>P</ITEMTYPE><ITEMID>unknown</ITEMID><ITEMDIMX>1</ITEMDIMX><ITEMDIMY>1</ITEMDIMY><ITEMDIMZ>1</ITEMDIMZ></ITEM>
+</CATALOG>
+'''
+
+
+class TestImportBricklinkAttributes(TestCase):
+
+    def setUp(self):
+        category = PartCategory.objects.create(id=1, name='category1')
+        self.part1 = Part.objects.create(part_num='part1', name='part1', category=category)
+        self.part2 = Part.objects.create(part_num='part2', name='part2', category=category)
+        self.part3 = Part.objects.create(part_num='part3', name='part3', category=category)
+        self.part4 = Part.objects.create(part_num='part4', name='part4', category=category)
+        # Plates get their height from the category
+        self.plate1 = Part.objects.create(
+            part_num='plate1', name='plate1', category=PartCategory.objects.create(id=2, name='Plates'))
+        PartExternalId.objects.create(
+            part=self.part2, provider=PartExternalId.BRICKLINK, external_id='bl_part2')
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.xml_path = os.path.join(self.temp_dir.name, 'Parts.xml')
+        with open(self.xml_path, 'w', encoding='utf-8') as file_ptr:
+            file_ptr.write(PARTS_XML)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_iter_items(self):
+        item_ids = [item.find('ITEMID').text for item in Command.iter_items(self.xml_path)]
+        self.assertEqual(item_ids, ['part1', 'bl_part2', 'part3', 'part4', 'plate1', 'unknown'])
+
+    def test_import_attributes(self):
+        import_stats = Command.import_attributes(self.xml_path)
+
+        self.assertEqual(import_stats['read'], 6)
+        self.assertEqual(import_stats['updated'], 4)
+        self.assertEqual(import_stats['skipped'], 1)
+
+        part1 = Part.objects.get(part_num='part1')
+        self.assertEqual(part1.width, Decimal(2))
+        self.assertEqual(part1.length, Decimal(4))
+        self.assertEqual(part1.height, Decimal(1))
+
+        part2 = Part.objects.get(part_num='part2')
+        self.assertEqual(part2.width, Decimal(1))
+        self.assertEqual(part2.length, Decimal(3))
+        self.assertIsNone(part2.height)
+        self.assertTrue(part2.attributes_dirty)
+
+        part3 = Part.objects.get(part_num='part3')
+        self.assertIsNone(part3.width)
+        self.assertFalse(part3.attributes_dirty)
+
+        # Compared as numbers, not strings
+        part4 = Part.objects.get(part_num='part4')
+        self.assertEqual(part4.width, Decimal(9))
+        self.assertEqual(part4.length, Decimal(10))
+
+        plate1 = Part.objects.get(part_num='plate1')
+        self.assertEqual((plate1.width, plate1.length, plate1.height), (Decimal(1), Decimal(2), Decimal('0.33')))
+
+    def test_import_attributes_unchanged(self):
+        Command.import_attributes(self.xml_path)
+        # As set_related_attributes leaves them
+        Part.objects.update(attributes_dirty=False)
+
+        import_stats = Command.import_attributes(self.xml_path)
+
+        self.assertEqual(import_stats['updated'], 0)
+        self.assertEqual(import_stats['skipped'], 5)
+        self.assertFalse(Part.objects.filter(attributes_dirty=True).exists())
+
+    def test_bricklink_id_multiple_parts(self):
+        PartExternalId.objects.create(
+            part=self.part3, provider=PartExternalId.BRICKLINK, external_id='bl_part2')
+
+        Command.import_attributes(self.xml_path)
+
+        self.assertEqual(Part.objects.get(part_num='part2').length, Decimal(3))
+        self.assertEqual(Part.objects.get(part_num='part3').length, Decimal(3))
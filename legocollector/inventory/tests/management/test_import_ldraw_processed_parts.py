@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from inventory.models import Part, PartCategory, PartExternalId
+from inventory.management.commands.import_ldraw_processed_parts import Command
+
+
+class TestImportLdrawData(TestCase):
+
+    def setUp(self):
+        category = PartCategory.objects.create(id=1, name='category1')
+        self.part1 = Part.objects.create(part_num='part1', name='part1', category=category)
+        self.part2 = Part.objects.create(part_num='part2', name='part2', category=category)
+        self.part3 = Part.objects.create(part_num='part3', name='part3', category=category)
+        PartExternalId.objects.create(part=self.part2, provider=PartExternalId.LDRAW, external_id='ld_part')
+        PartExternalId.objects.create(part=self.part3, provider=PartExternalId.LDRAW, external_id='ld_part')
+
+        self.data_dic = {
+            'part1': {'top_top_studs': 4, 'bottom_studs': 2, 'stud_ring_count': 1},
+            'ld_part': {'top_top_studs': 8, 'bottom_studs': 0, 'stud_ring_count': 0},
+            'part4': {'top_top_studs': 1, 'bottom_studs': 1, 'stud_ring_count': 1},
+        }
+
+    def test_import_studs(self):
+        import_stats = Command.import_ldraw_data(self.data_dic.items())
+
+        self.assertEqual(import_stats['read'], 3)
+        self.assertEqual(import_stats['updated'], 3)
+        self.assertEqual(import_stats['skipped'], 1)
+
+        part1 = Part.objects.get(part_num='part1')
+        self.assertEqual((part1.top_studs, part1.bottom_studs, part1.stud_rings), (4, 2, 1))
+        for part_num in ['part2', 'part3']:
+            part = Part.objects.get(part_num=part_num)
+            self.assertEqual((part.top_studs, part.bottom_studs, part.stud_rings), (8, 0, 0))
+
+        self.assertEqual(
+            sorted(Part.objects.filter(attributes_dirty=True).values_list('part_num', flat=True)),
+            ['part1', 'part2', 'part3'])
+
+    def test_import_unchanged(self):
+        Command.import_ldraw_data(self.data_dic.items())
+
+        # Parts and external ids are loaded up front, nothing is written inside the transaction
+        with self.assertNumQueries(4):
+            import_stats = Command.import_ldraw_data(self.data_dic.items())
+
+        self.assertEqual(import_stats['updated'], 0)
+        self.assertEqual(import_stats['skipped'], 4)
+
+    def test_processing_errors(self):
+        import_stats = Command.import_ldraw_data({'part1': {'processing_errors': ['error']}}.items())
+
+        self.assertEqual(import_stats['updated'], 0)
+        self.assertEqual(import_stats['skipped'], 1)
+        self.assertIsNone(Part.objects.get(part_num='part1').top_studs)
+
+    def test_command_streams_json_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_file_path = os.path.join(temp_dir, 'ldraw.json')
+            with open(json_file_path, 'w', encoding='utf-8') as file_ptr:
+                json.dump(self.data_dic, file_ptr)
+
+            call_command('import_ldraw_processed_parts', json_file_path)
+
+        self.assertEqual(Part.objects.get(part_num='part1').top_studs, 4)
+        self.assertEqual(Part.objects.get(part_num='part3').top_studs, 8)
@@ -0,0 +1,532 @@
+import csv
+import gzip
+import io
+import os
+import tempfile
+import zipfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from inventory.management import sql_merge
+from inventory.management.import_diff import DryRunImport
+from inventory.models import Color, ImportFileState, Part, PartCategory, PartRelationship, SetPart
+from inventory.management.commands.import_rebrickable_data import Command
+
+
+IMPORT_CSV_FILES = {
+    'colors': 'id,name,rgb,is_trans\n1,Red,C91A09,f\n',
+    'part_categories': 'id,name\n1,category1\n',
+    'parts': 'part_num,name,part_cat_id\npart1,Part 1,1\npart2,Part 2,1\n',
+    'part_relationships': 'rel_type,child_part_num,parent_part_num\nP,part2,part1\n',
+    'inventory_parts': 'inventory_id,part_num,color_id,quantity,is_spare\n1,part1,1,4,f\n',
+}
+
+
+def csv_text_from_rows(header, rows):
+    return '\n'.join([','.join(header)] + [','.join(str(v) for v in row) for row in rows])
+
+
+def csv_reader_from_rows(header, rows):
+    return csv.DictReader(io.StringIO(csv_text_from_rows(header, rows)))
+
+
+class TestPopulateParts(TestCase):
+
+    def setUp(self):
+        self.category1 = PartCategory.objects.create(id=1, name='category1')
+        self.category_plates = PartCategory.objects.create(id=2, name='Plates')
+
+        Part.objects.create(part_num='existing', name='existing', category=self.category1)
+
+    def test_create_new_parts(self):
+        reader = csv_reader_from_rows(
+            ['part_num', 'name', 'part_cat_id'],
+            [['new1', 'New 1', 1], ['new2', 'New 2', 2], ['existing', 'existing', 1]])
+
+        stats = Command._populate_parts(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(stats['read'], 3)
+        self.assertEqual(stats['inserted'], 2)
+        self.assertEqual(stats['updated'], 0)
+        self.assertEqual(stats['skipped'], 1)
+
+        self.assertEqual(Part.objects.count(), 3)
+        self.assertEqual(Part.objects.get(part_num='new1').category, self.category1)
+        self.assertIsNone(Part.objects.get(part_num='new1').height)
+        self.assertEqual(float(Part.objects.get(part_num='new2').height), 0.33)
+
+    def test_update_changed_parts(self):
+        reader = csv_reader_from_rows(
+            ['part_num', 'name', 'part_cat_id'],
+            [['existing', 'renamed', 2]])
+
+        stats = Command._populate_parts(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(stats['inserted'], 0)
+        self.assertEqual(stats['updated'], 1)
+
+        part = Part.objects.get(part_num='existing')
+        self.assertEqual(part.name, 'renamed')
+        self.assertEqual(part.category, self.category_plates)
+        self.assertEqual(float(part.height), 0.33)
+        self.assertTrue(part.attributes_dirty)
+
+    def test_renamed_plate_not_dirty(self):
+        Part.objects.create(part_num='plate', name='plate', category=self.category_plates)
+        reader = csv_reader_from_rows(
+            ['part_num', 'name', 'part_cat_id'],
+            [['plate', 'renamed plate', 2]])
+
+        stats = Command._populate_parts(reader)  # pylint: disable=protected-access
+
+        # The category height is unchanged, nothing to propagate to related parts
+        self.assertEqual(stats['updated'], 1)
+        part = Part.objects.get(part_num='plate')
+        self.assertEqual(part.name, 'renamed plate')
+        self.assertFalse(part.attributes_dirty)
+
+    def test_unknown_category_skipped(self):
+        reader = csv_reader_from_rows(
+            ['part_num', 'name', 'part_cat_id'],
+            [['new1', 'New 1', 99]])
+
+        stats = Command._populate_parts(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(stats['skipped'], 1)
+        self.assertFalse(Part.objects.filter(part_num='new1').exists())
+
+
+class TestPopulateRelationships(TestCase):
+
+    def setUp(self):
+        category = PartCategory.objects.create(id=1, name='category1')
+
+        self.part1 = Part.objects.create(part_num='part1', name='part1', category=category)
+        self.part2 = Part.objects.create(part_num='part2', name='part2', category=category)
+        self.part3 = Part.objects.create(part_num='part3', name='part3', category=category)
+
+        PartRelationship.objects.create(
+            parent_part=self.part1, child_part=self.part2, relationship_type=PartRelationship.ALTERNATE_PART)
+
+    def test_insert_update_skip(self):
+        reader = csv_reader_from_rows(
+            ['rel_type', 'child_part_num', 'parent_part_num'],
+            [['M', 'part2', 'part1'],
+             ['P', 'part3', 'part2'],
+             ['A', 'unknown', 'part1']])
+
+        stats = Command._populate_relationships(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(stats['read'], 3)
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(stats['skipped'], 1)
+
+        self.assertEqual(PartRelationship.objects.count(), 2)
+        self.assertEqual(
+            PartRelationship.objects.get(parent_part=self.part1, child_part=self.part2).relationship_type,
+            PartRelationship.DIFFERENT_MOLD)
+        self.assertEqual(
+            PartRelationship.objects.get(parent_part=self.part2, child_part=self.part3).relationship_type,
+            PartRelationship.DIFFERENT_PRINT)
+
+    def test_part_families_updated(self):
+        reader = csv_reader_from_rows(
+            ['rel_type', 'child_part_num', 'parent_part_num'],
+            [['A', 'part2', 'part1'], ['P', 'part3', 'part2']])
+
+        Command._populate_relationships(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(
+            sorted(Part.objects.get(part_num='part3').family_members.values_list('part_num', flat=True)),
+            ['part1', 'part2', 'part3'])
+
+    def test_removed_relationships_deleted(self):
+        reader = csv_reader_from_rows(
+            ['rel_type', 'child_part_num', 'parent_part_num'],
+            [['P', 'part3', 'part2']])
+
+        stats = Command._populate_relationships(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['deleted'], 1)
+        self.assertFalse(PartRelationship.objects.filter(parent_part=self.part1).exists())
+        self.assertIsNone(Part.objects.get(part_num='part1').family_id)
+        self.assertEqual(
+            sorted(Part.objects.get(part_num='part3').family_members.values_list('part_num', flat=True)),
+            ['part2', 'part3'])
+
+    def test_unchanged_skipped(self):
+        reader = csv_reader_from_rows(
+            ['rel_type', 'child_part_num', 'parent_part_num'],
+            [['A', 'part2', 'part1']])
+
+        stats = Command._populate_relationships(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(stats['inserted'], 0)
+        self.assertEqual(stats['updated'], 0)
+        self.assertEqual(stats['skipped'], 1)
+
+
+class TestPopulateSetParts(TestCase):
+
+    def setUp(self):
+        category = PartCategory.objects.create(id=1, name='category1')
+        self.part1 = Part.objects.create(part_num='part1', name='part1', category=category)
+        self.part2 = Part.objects.create(part_num='part2', name='part2', category=category)
+        self.color1 = Color.objects.create(id=1, name='Red', rgb='C91A09')
+
+        self.unchanged = SetPart.objects.create(
+            set_inventory=1, part=self.part1, color=self.color1, qty=1, is_spare=False)
+        self.changed = SetPart.objects.create(
+            set_inventory=1, part=self.part1, color=self.color1, qty=1, is_spare=True)
+        self.removed = SetPart.objects.create(
+            set_inventory=2, part=self.part1, color=self.color1, qty=1, is_spare=False)
+
+    def test_sync(self):
+        reader = csv_reader_from_rows(
+            ['inventory_id', 'part_num', 'color_id', 'quantity', 'is_spare'],
+            [[1, 'part1', 1, 1, 'f'],
+             [1, 'part1', 1, 5, 't'],
+             [3, 'part2', 1, 2, 'f'],
+             [3, 'unknown', 1, 2, 'f']])
+
+        stats = Command._populate_set_parts(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(stats['read'], 4)
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(stats['skipped'], 2)
+
+        self.assertEqual(SetPart.objects.count(), 3)
+        self.assertEqual(SetPart.objects.get(id=self.unchanged.id).qty, 1)
+        self.assertEqual(SetPart.objects.get(id=self.changed.id).qty, 5)
+        self.assertFalse(SetPart.objects.filter(id=self.removed.id).exists())
+        self.assertEqual(SetPart.objects.get(set_inventory=3, part=self.part2).qty, 2)
+
+
+class TestPopulateColors(TestCase):
+
+    def setUp(self):
+        Color.objects.create(id=1, name='Red', rgb='C91A09')
+        Color.objects.create(id=2, name='Blue', rgb='0055BF')
+
+    def test_insert_update_skip(self):
+        reader = csv_reader_from_rows(
+            ['id', 'name', 'rgb', 'is_trans'],
+            [[1, 'Red', 'C91A09', 'f'],
+             [2, 'Trans Blue', '0055BF', 't'],
+             [3, 'Green', '237841', 'f']])
+
+        stats = Command._populate_colors(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(stats['skipped'], 1)
+
+        blue = Color.objects.get(id=2)
+        self.assertEqual(blue.name, 'Trans Blue')
+        self.assertTrue(blue.transparent)
+
+        # Sort fields must match what Color.save() calculates
+        green = Color.objects.get(id=3)
+        hue, lum, value = Color.color_step(*green.rgb_ints)
+        self.assertEqual(green.color_step_hue, hue)
+        self.assertAlmostEqual(float(green.color_step_lumination), lum, places=14)
+        self.assertEqual(green.color_step_value, value)
+
+
+class TestPopulatePartCategories(TestCase):
+
+    def setUp(self):
+        PartCategory.objects.create(id=1, name='category1')
+
+    def test_insert_update(self):
+        reader = csv_reader_from_rows(
+            ['id', 'name'],
+            [[1, 'renamed'], [2, 'category2']])
+
+        stats = Command._populate_part_categories(reader)  # pylint: disable=protected-access
+
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(PartCategory.objects.get(id=1).name, 'renamed')
+        self.assertEqual(PartCategory.objects.get(id=2).name, 'category2')
+
+
+class TestImportFiles(TestCase):
+
+    def assert_imported(self):
+        self.assertEqual(Color.objects.count(), 1)
+        self.assertEqual(PartCategory.objects.count(), 1)
+        self.assertEqual(Part.objects.count(), 2)
+        self.assertEqual(PartRelationship.objects.count(), 1)
+        self.assertEqual(SetPart.objects.get().qty, 4)
+
+    def test_import_csv_dir(self):
+        with tempfile.TemporaryDirectory() as import_dir:
+            for name, text in IMPORT_CSV_FILES.items():
+                with open(os.path.join(import_dir, F'{name}.csv'), 'w', encoding='utf8') as file_ptr:
+                    file_ptr.write(text)
+
+            call_command('import_rebrickable_data', import_dir)
+
+        self.assert_imported()
+
+    def test_import_gzip_dir(self):
+        with tempfile.TemporaryDirectory() as import_dir:
+            for name, text in IMPORT_CSV_FILES.items():
+                with gzip.open(os.path.join(import_dir, F'{name}.csv.gz'), 'wt', encoding='utf8') as file_ptr:
+                    file_ptr.write(text)
+
+            call_command('import_rebrickable_data', import_dir)
+
+        self.assert_imported()
+
+    def test_import_set_parts_with_workers(self):
+        with tempfile.TemporaryDirectory() as import_dir:
+            for name, text in IMPORT_CSV_FILES.items():
+                with open(os.path.join(import_dir, F'{name}.csv'), 'w', encoding='utf8') as file_ptr:
+                    file_ptr.write(text)
+
+            call_command('import_rebrickable_data', import_dir, workers=2)
+
+        self.assert_imported()
+
+    def test_import_zip(self):
+        with tempfile.TemporaryDirectory() as import_dir:
+            zip_path = os.path.join(import_dir, 'rebrickable.zip')
+            with zipfile.ZipFile(zip_path, 'w') as zip_file:
+                for name, text in IMPORT_CSV_FILES.items():
+                    zip_file.writestr(F'rebrickable/{name}.csv.gz', gzip.compress(text.encode('utf8')))
+
+            call_command('import_rebrickable_data', zip_path)
+
+        self.assert_imported()
+
+    def test_missing_file(self):
+        with tempfile.TemporaryDirectory() as import_dir:
+            with self.assertRaises(CommandError):
+                call_command('import_rebrickable_data', import_dir)
+
+
+class TestSkipUnchangedFiles(TestCase):
+
+    def setUp(self):
+        self.import_dir_obj = tempfile.TemporaryDirectory()
+        self.import_dir = self.import_dir_obj.name
+        for name, text in IMPORT_CSV_FILES.items():
+            self.write_csv(name, text)
+
+    def tearDown(self):
+        self.import_dir_obj.cleanup()
+
+    def write_csv(self, name, text):
+        with open(os.path.join(self.import_dir, F'{name}.csv'), 'w', encoding='utf8') as file_ptr:
+            file_ptr.write(text)
+
+    def test_state_recorded(self):
+        call_command('import_rebrickable_data', self.import_dir)
+
+        self.assertEqual(ImportFileState.objects.count(), len(IMPORT_CSV_FILES))
+        self.assertEqual(ImportFileState.objects.get(name='parts').row_count, 2)
+
+    def test_unchanged_skipped(self):
+        call_command('import_rebrickable_data', self.import_dir)
+        SetPart.objects.all().delete()
+
+        # Unchanged files are skipped, the deleted SetPart is not restored
+        call_command('import_rebrickable_data', self.import_dir)
+        self.assertEqual(SetPart.objects.count(), 0)
+
+        # Changed files are imported
+        self.write_csv('inventory_parts', 'inventory_id,part_num,color_id,quantity,is_spare\n1,part1,1,2,f\n')
+        call_command('import_rebrickable_data', self.import_dir)
+        self.assertEqual(SetPart.objects.get().qty, 2)
+
+    def test_force(self):
+        call_command('import_rebrickable_data', self.import_dir)
+        SetPart.objects.all().delete()
+
+        call_command('import_rebrickable_data', self.import_dir, force=True)
+        self.assertEqual(SetPart.objects.get().qty, 4)
+
+
+class TestSqlBackend(TestCase):
+
+    def setUp(self):
+        self.category1 = PartCategory.objects.create(id=1, name='category1')
+        PartCategory.objects.create(id=2, name='Plates')
+        Color.objects.create(id=1, name='Red', rgb='C91A09')
+        self.part1 = Part.objects.create(part_num='part1', name='old name', category=self.category1, height=5)
+
+    def test_import(self):
+        with tempfile.TemporaryDirectory() as import_dir:
+            for name, text in IMPORT_CSV_FILES.items():
+                with open(os.path.join(import_dir, F'{name}.csv'), 'w', encoding='utf8') as file_ptr:
+                    file_ptr.write(text)
+
+            call_command('import_rebrickable_data', import_dir, backend='sql')
+
+        self.assertEqual(Color.objects.count(), 1)
+        self.assertEqual(Part.objects.count(), 2)
+        self.assertEqual(Part.objects.get(part_num='part1').name, 'Part 1')
+        self.assertEqual(PartRelationship.objects.get().relationship_type, PartRelationship.DIFFERENT_PRINT)
+        self.assertEqual(SetPart.objects.get().qty, 4)
+        self.assertEqual(self.part1.family_members.count(), 1)
+        self.assertEqual(Part.objects.get(part_num='part1').family_members.count(), 2)
+
+    def test_merge_colors(self):
+        reader = csv_reader_from_rows(
+            ['id', 'name', 'rgb', 'is_trans'],
+            [[1, 'Red', 'C91A09', 'f'], [2, 'Green', '237841', 't']])
+
+        stats = sql_merge.merge_colors(reader)
+
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['updated'], 0)
+        self.assertEqual(stats['skipped'], 1)
+
+        green = Color.objects.get(id=2)
+        self.assertTrue(green.transparent)
+        hue, lum, value = Color.color_step(*green.rgb_ints)
+        self.assertEqual(green.color_step_hue, hue)
+        self.assertAlmostEqual(float(green.color_step_lumination), lum, places=14)
+        self.assertEqual(green.color_step_value, value)
+
+    def test_merge_parts(self):
+        reader = csv_reader_from_rows(
+            ['part_num', 'name', 'part_cat_id'],
+            [['part1', 'old name', 1], ['part2', 'Plate', 2], ['part3', 'Unknown', 99]])
+
+        stats = sql_merge.merge_parts(reader)
+
+        self.assertEqual(stats['read'], 3)
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['updated'], 0)
+        self.assertEqual(stats['skipped'], 2)
+        self.assertEqual(Part.objects.get(part_num='part1').height, 5)
+        self.assertEqual(float(Part.objects.get(part_num='part2').height), 0.33)
+
+        # Category change applies the category height
+        reader = csv_reader_from_rows(['part_num', 'name', 'part_cat_id'], [['part1', 'old name', 2]])
+        stats = sql_merge.merge_parts(reader)
+
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(float(Part.objects.get(part_num='part1').height), 0.33)
+
+    def test_merge_parts_dirty(self):
+        reader = csv_reader_from_rows(['part_num', 'name', 'part_cat_id'], [['part2', 'Plate', 2]])
+        sql_merge.merge_parts(reader)
+
+        # New parts are not dirty
+        self.assertFalse(Part.objects.get(part_num='part2').attributes_dirty)
+
+        # Only a changed height marks a changed part dirty, like in the orm import
+        reader = csv_reader_from_rows(
+            ['part_num', 'name', 'part_cat_id'], [['part1', 'new name', 2], ['part2', 'Plate 2', 2]])
+        stats = sql_merge.merge_parts(reader)
+
+        self.assertEqual(stats['updated'], 2)
+        self.assertEqual(Part.objects.get(part_num='part2').name, 'Plate 2')
+        self.assertTrue(Part.objects.get(part_num='part1').attributes_dirty)
+        self.assertFalse(Part.objects.get(part_num='part2').attributes_dirty)
+
+        # Dirty parts stay dirty until set_related_attributes clears them
+        reader = csv_reader_from_rows(['part_num', 'name', 'part_cat_id'], [['part1', 'newer name', 2]])
+        sql_merge.merge_parts(reader)
+
+        self.assertTrue(Part.objects.get(part_num='part1').attributes_dirty)
+
+    def test_merge_relationships(self):
+        part2 = Part.objects.create(part_num='part2', name='part2', category=self.category1)
+        PartRelationship.objects.create(
+            parent_part=self.part1, child_part=part2, relationship_type=PartRelationship.ALTERNATE_PART)
+
+        reader = csv_reader_from_rows(
+            ['rel_type', 'child_part_num', 'parent_part_num'],
+            [['M', 'part2', 'part1'], ['P', 'part1', 'part2'], ['A', 'unknown', 'part1']])
+
+        stats = sql_merge.merge_relationships(reader)
+
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(
+            PartRelationship.objects.get(parent_part=self.part1).relationship_type, PartRelationship.DIFFERENT_MOLD)
+
+        # Relationships no longer in the file are removed
+        reader = csv_reader_from_rows(['rel_type', 'child_part_num', 'parent_part_num'], [['P', 'part1', 'part2']])
+        stats = sql_merge.merge_relationships(reader)
+
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(stats['skipped'], 1)
+        self.assertEqual(PartRelationship.objects.get().parent_part, part2)
+
+
+class TestDryRun(TestCase):
+
+    def setUp(self):
+        self.category1 = PartCategory.objects.create(id=1, name='category1')
+        self.color1 = Color.objects.create(id=1, name='Red', rgb='C91A09')
+        self.part1 = Part.objects.create(part_num='part1', name='part1', category=self.category1)
+
+        for set_inventory in range(1, 5):
+            SetPart.objects.create(
+                set_inventory=set_inventory, part=self.part1, color=self.color1, qty=1, is_spare=False)
+
+    def test_no_writes(self):
+        with tempfile.TemporaryDirectory() as import_dir:
+            for name, text in IMPORT_CSV_FILES.items():
+                with open(os.path.join(import_dir, F'{name}.csv'), 'w', encoding='utf8') as file_ptr:
+                    file_ptr.write(text)
+
+            call_command('import_rebrickable_data', import_dir, dry_run=True)
+
+        self.assertEqual(Part.objects.count(), 1)
+        self.assertEqual(Part.objects.get().name, 'part1')
+        self.assertEqual(PartRelationship.objects.count(), 0)
+        self.assertEqual(SetPart.objects.count(), 4)
+        self.assertFalse(ImportFileState.objects.exists())
+
+    def test_diff_parts_and_relationships(self):
+        dry_run = DryRunImport()
+
+        diff = dry_run.diff_parts(csv_reader_from_rows(
+            ['part_num', 'name', 'part_cat_id'],
+            [['part1', 'renamed', 1], ['part2', 'Part 2', 1], ['part3', 'Part 3', 99]]))
+        self.assertEqual(diff.import_stats['inserted'], 1)
+        self.assertEqual(diff.import_stats['updated'], 1)
+        self.assertEqual(diff.import_stats['skipped'], 1)
+        self.assertEqual(len(diff.samples['updated']), 1)
+
+        # part2 would be created by the parts import, the relationship to part_old is not in the file anymore
+        PartRelationship.objects.create(
+            parent_part=self.part1, relationship_type=PartRelationship.ALTERNATE_PART,
+            child_part=Part.objects.create(part_num='part_old', name='part_old', category=self.category1))
+        diff = dry_run.diff_relationships(csv_reader_from_rows(
+            ['rel_type', 'child_part_num', 'parent_part_num'],
+            [['P', 'part2', 'part1'], ['P', 'part3', 'part1']]))
+        self.assertEqual(diff.import_stats['inserted'], 1)
+        self.assertEqual(diff.import_stats['skipped'], 1)
+        self.assertEqual(diff.import_stats['deleted'], 1)
+
+    def test_diff_set_parts_partitioned(self):
+        csv_text = csv_text_from_rows(
+            ['inventory_id', 'part_num', 'color_id', 'quantity', 'is_spare'],
+            [[1, 'part1', 1, 1, 'f'],
+             [2, 'part1', 1, 3, 'f'],
+             [5, 'part1', 1, 1, 'f'],
+             [6, 'unknown', 1, 1, 'f']])
+
+        for partition_rows in (1, 100):
+            diff = DryRunImport().diff_set_parts(lambda: io.StringIO(csv_text), partition_rows=partition_rows)
+
+            self.assertEqual(diff.import_stats['read'], 4)
+            self.assertEqual(diff.import_stats['inserted'], 1)
+            self.assertEqual(diff.import_stats['updated'], 1)
+            self.assertEqual(diff.import_stats['deleted'], 2)
+            self.assertEqual(diff.import_stats['skipped'], 2)
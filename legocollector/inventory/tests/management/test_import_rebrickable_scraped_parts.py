@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from inventory.models import Part, PartCategory, PartExternalId
+from inventory.management.commands.import_rebrickable_scraped_parts import Command
+
+
+class TestImportScrapedData(TestCase):
+
+    def setUp(self):
+        category = PartCategory.objects.create(id=1, name='category1')
+        self.part1 = Part.objects.create(part_num='part1', name='part1', category=category)
+        self.part2 = Part.objects.create(
+            part_num='part2', name='part2', category=category, image_url='http://image/old.png')
+        PartExternalId.objects.create(part=self.part1, provider=PartExternalId.BRICKLINK, external_id='bl1')
+
+        self.parts_dic = {
+            'part1': {'part_img_url': 'http://image/1.png',
+                      'external_ids': {'BrickLink': ['bl1', ' bl1b '], 'LDraw': ['ld1']}},
+            'part2': {'part_img_url': None, 'external_ids': {'BrickOwl': ['bo2']}},
+            'unknown': {'part_img_url': 'http://image/x.png', 'external_ids': {'BrickLink': ['x']}},
+        }
+
+    def test_import(self):
+        import_stats = Command().import_scraped_data(self.parts_dic.items())
+
+        self.assertEqual(import_stats['read'], 3)
+        self.assertEqual(import_stats['inserted'], 0)
+        self.assertEqual(import_stats['external_ids_inserted'], 3)
+        self.assertEqual(import_stats['updated'], 2)
+        self.assertEqual(import_stats['skipped'], 1)
+
+        self.assertEqual(Part.objects.get(part_num='part1').image_url, 'http://image/1.png')
+        self.assertEqual(Part.objects.get(part_num='part2').image_url, 'http://image/old.png')
+        self.assertEqual(
+            sorted(PartExternalId.objects.values_list('part__part_num', 'provider', 'external_id')),
+            [('part1', PartExternalId.BRICKLINK, 'bl1'), ('part1', PartExternalId.BRICKLINK, 'bl1b'),
+             ('part1', PartExternalId.LDRAW, 'ld1'), ('part2', PartExternalId.BRICKOWL, 'bo2')])
+
+        # Only the part with a new image needs its family attributes propagated
+        self.assertTrue(Part.objects.get(part_num='part1').attributes_dirty)
+        self.assertFalse(Part.objects.get(part_num='part2').attributes_dirty)
+
+    def test_unchanged_parts_skipped(self):
+        Command().import_scraped_data(self.parts_dic.items())
+
+        self.parts_dic['part2']['external_ids']['BrickOwl'].append('bo2b')
+        import_stats = Command().import_scraped_data(self.parts_dic.items())
+
+        self.assertEqual(import_stats['external_ids_inserted'], 1)
+        self.assertEqual(import_stats['updated'], 1)
+        self.assertEqual(import_stats['skipped'], 2)
+        self.assertTrue(PartExternalId.objects.filter(part=self.part2, external_id='bo2b').exists())
+
+    def test_command_streams_json_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_file_path = os.path.join(temp_dir, 'scraped.json')
+            with open(json_file_path, 'w', encoding='utf-8') as file_ptr:
+                json.dump({'parts': self.parts_dic}, file_ptr)
+
+            call_command('import_rebrickable_scraped_parts', json_file_path)
+
+        self.assertEqual(PartExternalId.objects.count(), 4)
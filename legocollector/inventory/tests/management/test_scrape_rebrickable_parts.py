@@ -0,0 +1,303 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from inventory.management.commands.scrape_rebrickable_parts import Command
+from utils.json_journal import JsonJournal
+from utils.rate_limit import RetryPolicy, TokenBucket
+from utils.rebrickable_fetch import AdaptiveBatchSize
+from utils.scrape_cache import CachePolicy, ScrapeCache
+from utils.scrape_queue import ScrapeQueue
+
+
+class StubRebrickableHandler(BaseHTTPRequestHandler):
+    # Answers like the Rebrickable parts api, the first "fail_count" requests get a 429
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            server.request_paths.append(self.path)
+            fail = server.request_count <= server.fail_count
+
+        if fail:
+            self.send_response(429)
+            self.end_headers()
+            return
+
+        part_nums = parse_qs(urlparse(self.path).query)['part_nums'][0].split(',')
+        body = json.dumps({'results': [{'part_num': p, 'name': F'Name {p}'} for p in part_nums]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+            server.gzip_count += 1
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class TestScrapeRebrickableParts(TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), StubRebrickableHandler)
+        self.server.lock = threading.Lock()
+        self.server.request_count = 0
+        self.server.fail_count = 0
+        self.server.gzip_count = 0
+        self.server.request_paths = []
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.json_file_path = os.path.join(self.temp_dir.name, 'scrape.json')
+        self.csv_path = os.path.join(self.temp_dir.name, 'parts.csv')
+        with open(self.csv_path, 'w', encoding='utf8') as file_ptr:
+            file_ptr.write('part_num,name,part_cat_id\n')
+            for idx in range(25):
+                file_ptr.write(F'part{idx},Part {idx},1\n')
+
+        self.command = Command()
+        self.command.batch_size = AdaptiveBatchSize(10, minimum=10, maximum=10)
+        self.command.base_url = F'http://127.0.0.1:{self.server.server_port}/api/v3/lego/parts/'
+        self.command.retry = RetryPolicy(TokenBucket(1000), base_delay=0.01)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def _load_result(self):
+        with open(self.json_file_path, 'r', encoding='utf-8') as file_ptr:
+            return json.load(file_ptr)
+
+    def test_concurrent_scrape(self):
+        self.command.workers = 3
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        self.assertEqual(import_stats['read'], 25)
+        self.assertEqual(import_stats['inserted'], 25)
+        self.assertEqual(self.server.request_count, 3)
+        self.assertEqual(self.server.gzip_count, 3)
+
+        json_dic = self._load_result()
+        self.assertEqual(json_dic['unscraped_parts'], [])
+        self.assertEqual(sorted(json_dic['parts']), sorted(F'part{idx}' for idx in range(25)))
+        self.assertEqual(json_dic['parts']['part7'], {'part_num': 'part7', 'name': 'Name part7'})
+
+    def test_retry_on_429(self):
+        self.server.fail_count = 2
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        self.assertEqual(import_stats['inserted'], 25)
+        self.assertEqual(self.server.request_count, 5)
+
+    def test_retries_exhausted(self):
+        self.server.fail_count = 100
+        self.command.retry.max_retries = 1
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        self.assertEqual(import_stats['skipped'], 25)
+        self.assertEqual(self.server.request_count, 6)
+
+        # Failed parts stay unscraped for the next run
+        json_dic = self._load_result()
+        self.assertEqual(sorted(json_dic['unscraped_parts']), sorted(F'part{idx}' for idx in range(25)))
+        self.assertEqual(json_dic['parts'], {})
+
+    def test_resume_from_journal(self):
+        # State of a run that stopped after journaling one batch, in the middle of writing the next one
+        with open(self.json_file_path, 'w', encoding='utf-8') as file_ptr:
+            json.dump({'unscraped_parts': ['part1', 'part2', 'part3', 'part4'], 'parts': {}}, file_ptr)
+        journal = JsonJournal(F'{self.json_file_path}.journal')
+        journal.append({'part_nums': ['part1', 'part2'], 'results': [{'part_num': 'part1', 'name': 'Old'}]})
+        with open(journal.path, 'a', encoding='utf-8') as file_ptr:
+            file_ptr.write('{"part_nums": ["part3", "par')
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, None)
+
+        # Only the parts without a complete journal record are scraped again
+        self.assertEqual(import_stats['read'], 2)
+        self.assertFalse(journal.exists())
+
+        json_dic = self._load_result()
+        self.assertEqual(json_dic['unscraped_parts'], [])
+        self.assertEqual(sorted(json_dic['parts']), ['part1', 'part3', 'part4'])
+        self.assertEqual(json_dic['parts']['part1']['name'], 'Old')
+
+    def test_journal_written_per_batch(self):
+        journal_path = F'{self.json_file_path}.journal'
+        journal_sizes = []
+
+        def scrape(fetcher, url):
+            journal_sizes.append(len(list(JsonJournal(journal_path).records())))
+            return scrape_orig(fetcher, url)
+
+        scrape_orig = self.command._scrape  # pylint: disable=protected-access
+        self.command._scrape = scrape  # pylint: disable=protected-access
+
+        self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        self.assertEqual(journal_sizes, [0, 1, 2])
+        self.assertFalse(os.path.exists(journal_path))
+
+    def test_max_age_uses_cache(self):
+        cache_path = os.path.join(self.temp_dir.name, 'cache.sqlite3')
+        with ScrapeCache(cache_path) as cache:
+            self.command.cache_policy = CachePolicy(cache)
+            self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+        self.assertEqual(self.server.request_count, 3)
+
+        # Only part_nums missing from the cache are scraped
+        with open(self.csv_path, 'a', encoding='utf8') as file_ptr:
+            file_ptr.write('part99,Part 99,1\n')
+        os.remove(self.json_file_path)
+        with ScrapeCache(cache_path) as cache:
+            self.command.cache_policy = CachePolicy(cache, max_age=3600)
+            import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        self.assertEqual(self.server.request_count, 4)
+        self.assertEqual(import_stats['read'], 26)
+        self.assertEqual(import_stats['inserted'], 1)
+        self.assertEqual(len(self._load_result()['parts']), 26)
+
+    def test_offline_replay(self):
+        cache_path = os.path.join(self.temp_dir.name, 'cache.sqlite3')
+        with ScrapeCache(cache_path) as cache:
+            cache.store(['part1', 'part2'], [{'part_num': 'part1', 'name': 'Cached'}])
+
+        with ScrapeCache(cache_path) as cache:
+            self.command.cache_policy = CachePolicy(cache, offline=True)
+            self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        self.assertEqual(self.server.request_count, 0)
+        json_dic = self._load_result()
+        self.assertEqual(json_dic['parts'], {'part1': {'part_num': 'part1', 'name': 'Cached'}})
+        self.assertEqual(len(json_dic['unscraped_parts']), 23)
+
+    def test_offline_needs_cache_path(self):
+        with self.assertRaises(CommandError):
+            call_command('scrape_rebrickable_parts', 'key', self.json_file_path, offline=True)
+
+    def test_batch_size_adapts(self):
+        self.command.batch_size = AdaptiveBatchSize(4, minimum=2, maximum=12, target_latency=60)
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        self.assertEqual(import_stats['inserted'], 25)
+        batch_sizes = [len(parse_qs(urlparse(path).query)['part_nums'][0].split(','))
+                       for path in self.server.request_paths]
+        self.assertEqual(batch_sizes, [4, 6, 9, 6])
+        page_sizes = [int(parse_qs(urlparse(path).query)['page_size'][0]) for path in self.server.request_paths]
+        self.assertEqual(page_sizes, batch_sizes)
+
+    def test_batch_limited_by_url_length(self):
+        self.command.batch_size = AdaptiveBatchSize(1000, maximum=1000)
+        part_nums = [F'{idx:0>20}' for idx in range(1000)]
+
+        with ScrapeQueue(os.path.join(self.temp_dir.name, 'queue.sqlite3')) as queue:
+            queue.add(part_nums)
+            _, scrape_list = self.command._claim_scrape_list(queue, 'key')  # pylint: disable=protected-access
+
+            # The part_nums not fitting into the url go back to the queue
+            self.assertLess(len(scrape_list), 1000)
+            self.assertEqual(
+                queue.status_counts(), {'in_flight': len(scrape_list), 'pending': 1000 - len(scrape_list)})
+
+        url = self.command._form_scrape_url(  # pylint: disable=protected-access
+            scrape_list, 'key', self.command.base_url)
+        self.assertLessEqual(len(url), 4000)
+
+    def test_part_nums_quoted(self):
+        with open(self.csv_path, 'w', encoding='utf8') as file_ptr:
+            file_ptr.write('part_num,name,part_cat_id\n3626c&d,Part A,1\n973#1,Part B,1\npart1,Part C,1\n')
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        self.assertEqual(import_stats['inserted'], 3)
+        self.assertEqual(self.server.request_count, 1)
+        self.assertIn('part_nums=3626c%26d,973%231,part1&', self.server.request_paths[0])
+        json_dic = self._load_result()
+        self.assertEqual(json_dic['unscraped_parts'], [])
+        self.assertEqual(sorted(json_dic['parts']), ['3626c&d', '973#1', 'part1'])
+
+    def test_shared_queue(self):
+        queue_path = os.path.join(self.temp_dir.name, 'queue.sqlite3')
+        self.command.queue_path = queue_path
+
+        # Another process holds part0-part9 and part10-part19 is done already
+        with ScrapeQueue(queue_path) as queue:
+            queue.add(F'part{idx}' for idx in range(25))
+            queue.claim(10)
+            batch_id, _ = queue.claim(10)
+            queue.complete(batch_id)
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        self.assertEqual(import_stats['read'], 5)
+        json_dic = self._load_result()
+        self.assertEqual(sorted(json_dic['parts']), sorted(F'part{idx}' for idx in range(20, 25)))
+        self.assertEqual(json_dic['unscraped_parts'], [F'part{idx}' for idx in range(10)])
+        self.assertTrue(os.path.exists(queue_path))
+
+    def test_failed_batches_requeued_next_run(self):
+        self.server.fail_count = 1
+        self.command.retry.max_retries = 0
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+        self.assertEqual(import_stats['skipped'], 10)
+        self.assertEqual(len(self._load_result()['unscraped_parts']), 10)
+        self.assertTrue(os.path.exists(F'{self.json_file_path}.queue'))
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, None)
+        self.assertEqual(import_stats['inserted'], 10)
+        self.assertEqual(len(self._load_result()['parts']), 25)
+        self.assertFalse(os.path.exists(F'{self.json_file_path}.queue'))
+
+    def test_reused_queue_path(self):
+        self.command.queue_path = os.path.join(self.temp_dir.name, 'queue.sqlite3')
+        self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+
+        # A later campaign into a new json file finds every part done in the queue
+        os.remove(self.json_file_path)
+        with self.assertLogs('inventory.management.commands.scrape_rebrickable_parts', 'WARNING'):
+            import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+        self.assertEqual(import_stats['read'], 0)
+
+        os.remove(self.json_file_path)
+        self.command.reset_queue = True
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, self.csv_path)
+        self.assertEqual(import_stats['read'], 25)
+        self.assertEqual(len(self._load_result()['parts']), 25)
+
+    def test_own_claims_released_after_crash(self):
+        # The previous run of this scraper stopped with a batch in flight
+        queue_path = F'{self.json_file_path}.queue'
+        with open(self.json_file_path, 'w', encoding='utf-8') as file_ptr:
+            json.dump({'unscraped_parts': [F'part{idx}' for idx in range(25)], 'parts': {}}, file_ptr)
+        owner = self.command._queue_owner(self.json_file_path)  # pylint: disable=protected-access
+        with ScrapeQueue(queue_path, owner=owner) as queue:
+            queue.add(F'part{idx}' for idx in range(25))
+            queue.claim(10)
+
+        import_stats = self.command.scrape_rebrickable_parts('key', self.json_file_path, None)
+
+        self.assertEqual(import_stats['read'], 25)
+        self.assertEqual(self._load_result()['unscraped_parts'], [])
+        self.assertFalse(os.path.exists(queue_path))
@@ -1,9 +1,11 @@
 from collections import defaultdict
 
+from django.core.management import call_command
 from django.test import TestCase
 
 from inventory.models import Part, PartCategory, PartRelationship
 from inventory.management.commands.set_related_attributes import Command
+from inventory.part_families import update_part_families
 
 
 class TestRelatedAttributes(TestCase):
@@ -30,9 +32,17 @@ class TestRelatedAttributes(TestCase):
             child_part=self.part3,
             relationship_type=PartRelationship.ALTERNATE_PART)
 
+    def _set_family_attribs(self):
+        # The parts saved by the tests carry a stale family_id
+        update_part_families()
+        part_families = Command.get_part_families()
+        self.assertEqual(len(part_families), 1)
+
+        for part in Command.set_family_attribs(part_families[0], attribute_updates=self.attribute_updates):
+            part.save()
+
     def test_no_dims_no_studs_present(self):
-        Command.set_related_attribs_for_part(
-            self.part1, attribute_updates=self.attribute_updates)
+        self._set_family_attribs()
 
         part1 = Part.objects.get(part_num='part1')
         part2 = Part.objects.get(part_num='part2')
@@ -60,8 +70,7 @@ class TestRelatedAttributes(TestCase):
         self.part3.stud_rings = 300
         self.part3.save()
 
-        Command.set_related_attribs_for_part(
-            self.part1, attribute_updates=self.attribute_updates)
+        self._set_family_attribs()
 
         part1 = Part.objects.get(part_num='part1')
         part2 = Part.objects.get(part_num='part2')
@@ -116,8 +125,7 @@ class TestRelatedAttributes(TestCase):
         self.part3.bottom_studs = 300
         self.part3.save()
 
-        Command.set_related_attribs_for_part(
-            self.part1, attribute_updates=self.attribute_updates)
+        self._set_family_attribs()
 
         part1 = Part.objects.get(part_num='part1')
         part2 = Part.objects.get(part_num='part2')
@@ -154,3 +162,70 @@ class TestRelatedAttributes(TestCase):
         self.assertEqual(part1.image_url, 'www.image_url.com')
         self.assertEqual(part2.image_url, 'www.image_url.com')
         self.assertEqual(part3.image_url, 'www.image_url.com')
+
+
+class TestRelatedAttributesCommand(TestCase):
+
+    def setUp(self):
+        self.category = PartCategory.objects.create(id=1, name='category1')
+        for idx in range(1, 7):
+            Part.objects.create(part_num=F'part{idx}', name=F'part{idx}', category=self.category)
+
+        # Families: part1 <- part2 <- part3 (with a cycle back to part1), part4 <- part5, part6 alone
+        for parent, child in [(1, 2), (2, 3), (3, 1), (4, 5)]:
+            PartRelationship.objects.create(
+                parent_part=Part.objects.get(part_num=F'part{parent}'),
+                child_part=Part.objects.get(part_num=F'part{child}'),
+                relationship_type=PartRelationship.ALTERNATE_PART)
+        update_part_families()
+
+    def test_part_families(self):
+        families = sorted(sorted(p.part_num for p in family) for family in Command.get_part_families())
+        self.assertEqual(families, [['part1', 'part2', 'part3'], ['part4', 'part5']])
+
+    def test_command_updates_families(self):
+        Part.objects.filter(part_num='part3').update(width=2, length=4, top_studs=8)
+        Part.objects.filter(part_num='part5').update(image_url='www.image_url.com')
+        Part.objects.filter(part_num='part6').update(width=1)
+
+        call_command('set_related_attributes')
+
+        for part_num in ['part1', 'part2', 'part3']:
+            part = Part.objects.get(part_num=part_num)
+            self.assertEqual((part.width, part.length, part.top_studs), (2, 4, 8))
+            self.assertIsNone(part.image_url)
+
+        self.assertEqual(Part.objects.get(part_num='part4').image_url, 'www.image_url.com')
+        self.assertIsNone(Part.objects.get(part_num='part4').width)
+        self.assertIsNone(Part.objects.get(part_num='part6').length)
+
+    def test_query_count_independent_of_family_size(self):
+        Part.objects.filter(part_num='part1').update(width=1)
+
+        # Savepoint, parts, one bulk update, clearing the dirty flags and the savepoint release
+        with self.assertNumQueries(5):
+            call_command('set_related_attributes')
+
+    def test_family_update_marks_parts_dirty(self):
+        self.assertEqual(
+            sorted(Part.objects.filter(attributes_dirty=True).values_list('part_num', flat=True)),
+            ['part1', 'part2', 'part3', 'part4', 'part5'])
+
+        call_command('set_related_attributes')
+        self.assertFalse(Part.objects.filter(attributes_dirty=True).exists())
+
+    def test_incremental_only_processes_dirty_families(self):
+        call_command('set_related_attributes')
+
+        # Changed outside the importers, so not marked dirty
+        Part.objects.filter(part_num='part1').update(width=3)
+        Part.objects.filter(part_num='part4').update(width=5, attributes_dirty=True)
+
+        call_command('set_related_attributes', '--incremental')
+
+        self.assertIsNone(Part.objects.get(part_num='part2').width)
+        self.assertEqual(Part.objects.get(part_num='part5').width, 5)
+        self.assertFalse(Part.objects.filter(attributes_dirty=True).exists())
+
+        call_command('set_related_attributes')
+        self.assertEqual(Part.objects.get(part_num='part2').width, 3)
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from inventory.models import Part, PartCategory
+from inventory.management.telemetry import ImportReport
+
+
+class TestImportReport(TestCase):
+
+    def test_stage_counts(self):
+        report = ImportReport('test_command')
+        with report.stage('parts') as stage_stats:
+            stage_stats.update({'read': 10, 'inserted': 4, 'updated': 2})
+            PartCategory.objects.create(id=1, name='category1')
+        report.skip_stage('colors', 'unchanged')
+
+        stage = report.as_dict()['stages'][0]
+        self.assertEqual(stage['name'], 'parts')
+        self.assertEqual(stage['status'], 'done')
+        self.assertEqual(stage['rows_read'], 10)
+        self.assertEqual(stage['rows_inserted'], 4)
+        self.assertEqual(stage['rows_updated'], 2)
+        self.assertEqual(stage['rows_skipped'], 0)
+        self.assertGreaterEqual(stage['queries'], 1)
+        self.assertEqual(report.as_dict()['stages'][1]['status'], 'skipped')
+
+    def test_failed_stage_recorded(self):
+        report = ImportReport('test_command')
+        with self.assertRaises(ValueError):
+            with report.stage('parts'):
+                raise ValueError('Import failed')
+
+        self.assertEqual(report.as_dict()['stages'][0]['status'], 'failed')
+
+
+class TestReportCommand(TestCase):
+
+    def setUp(self):
+        category = PartCategory.objects.create(id=1, name='category1')
+        Part.objects.create(part_num='part1', name='part1', category=category)
+
+    def test_report_path(self):
+        with tempfile.TemporaryDirectory() as report_dir:
+            report_path = os.path.join(report_dir, 'report.json')
+            call_command('show_db_details', report_path=report_path)
+
+            with open(report_path, encoding='utf-8') as file_ptr:
+                report = json.load(file_ptr)
+
+        self.assertEqual(report['command'], 'show_db_details')
+        self.assertListEqual([s['name'] for s in report['stages']], ['category_details', 'part_details'])
+        self.assertEqual(report['stages'][1]['rows_read'], 1)
+
+    def test_report_dir_setting(self):
+        with tempfile.TemporaryDirectory() as report_dir:
+            with override_settings(IMPORT_REPORT_DIR=report_dir):
+                call_command('guess_dimensions_from_part_names')
+
+            report_files = os.listdir(report_dir)
+
+        self.assertEqual(len(report_files), 1)
+        self.assertTrue(report_files[0].startswith('guess_dimensions_from_part_names_'))
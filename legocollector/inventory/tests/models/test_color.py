@@ -1,5 +1,8 @@
+from unittest import skipIf
+
 from django.test import TestCase
 
+from inventory import models
 from inventory.models import Color
 
 
@@ -18,3 +21,25 @@ class TestColorCreation(TestCase):  # pylint: disable=too-many-instance-attribut
         self.assertEqual(self.color_red.color_step_hue, 0)
         self.assertAlmostEqual(self.color_red.color_step_lumination, 8.18651329932347, places=14, msg=None, delta=None)
         self.assertEqual(self.color_red.color_step_value, 1608)
+
+
+class TestColorSteps(TestCase):
+
+    def setUp(self):
+        self.rgb_list = [
+            (201, 26, 9), (0, 0, 0), (255, 255, 255), (128, 128, 128),
+            (0, 255, 0), (0, 0, 255), (255, 255, 0), (5, 19, 29), (160, 188, 172)]
+
+    def test_python_matches_single_step(self):
+        self.assertListEqual(
+            Color.color_steps(self.rgb_list, use_numpy=False),
+            [Color.color_step(*rgb) for rgb in self.rgb_list])
+
+    @skipIf(models.numpy is None, 'numpy not installed')
+    def test_numpy_matches_python(self):
+        self.assertListEqual(
+            Color.color_steps(self.rgb_list, use_numpy=True),
+            Color.color_steps(self.rgb_list, use_numpy=False))
+
+    def test_empty_palette(self):
+        self.assertListEqual(Color.color_steps([]), [])
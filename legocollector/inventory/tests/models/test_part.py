@@ -1,6 +1,7 @@
 from django.test import TestCase
 
 from inventory.models import Color, Part, PartCategory, PartRelationship, SetPart
+from inventory.part_families import deferred_family_updates, update_part_families
 
 
 class TestGetRelatedParts(TestCase):
@@ -201,6 +202,30 @@ class TestGetRelatedParts(TestCase):
             for target in target_list:
                 self.assertIn(target, related_parts)
 
+    def test_transitive_related_parts_single_query(self):
+        part_1 = Part.objects.get(part_num='1')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(part_1.get_related_parts(parents=True, children=True, transitive=True)), 5)
+        with self.assertNumQueries(1):
+            self.assertEqual(part_1.related_part_count(parents=True, children=True, transitive=True), 5)
+
+    def test_related_parts_relationship_type(self):
+        PartRelationship.objects.filter(parent_part__part_num='B').update(
+            relationship_type=PartRelationship.DIFFERENT_PRINT)
+        part_1 = Part.objects.get(part_num='1')
+        part_a = Part.objects.get(part_num='A')
+
+        related_parts = part_1.get_related_parts(
+            parents=True, children=True, transitive=True, relationship_type=PartRelationship.ALTERNATE_PART)
+        self.assertEqual(sorted(p.part_num for p in related_parts), ['2', '3', 'A', 'C'])
+        self.assertEqual(part_1.related_part_count(
+            parents=True, children=True, transitive=True, relationship_type=PartRelationship.DIFFERENT_PRINT), 0)
+        self.assertEqual(
+            [p.part_num for p in part_a.get_related_parts(
+                parents=True, children=False, transitive=False, relationship_type=PartRelationship.DIFFERENT_PRINT)],
+            ['B'])
+
 
 class TestAvailableColors(TestCase):
 
@@ -387,3 +412,71 @@ class TestSetInventories(TestCase):
 
         self.assertListEqual(part.set_inventories, [1])
         self.assertEqual(part.set_count, 1)
+
+
+class TestPartFamilies(TestCase):
+
+    def setUp(self):
+        self.category = PartCategory.objects.create(id=1, name='category1')
+        self.parts = {}
+        for part_num in ['1', '2', '3', '4', '5', 'single']:
+            self.parts[part_num] = Part.objects.create(part_num=part_num, name=part_num, category=self.category)
+
+    def _relate(self, parent, child):
+        # Without the signal handler updating the families, the tests call update_part_families() themselves
+        with deferred_family_updates():
+            relationship = PartRelationship.objects.create(
+                parent_part=self.parts[parent], child_part=self.parts[child],
+                relationship_type=PartRelationship.ALTERNATE_PART)
+        return relationship
+
+    def _family_part_nums(self, part_num):
+        return sorted(Part.objects.get(part_num=part_num).family_members.values_list('part_num', flat=True))
+
+    def test_full_update(self):
+        self._relate('1', '2')
+        self._relate('3', '2')
+        self._relate('4', '5')
+
+        self.assertEqual(update_part_families(), 5)
+
+        self.assertEqual(self._family_part_nums('1'), ['1', '2', '3'])
+        self.assertEqual(self._family_part_nums('3'), ['1', '2', '3'])
+        self.assertEqual(self._family_part_nums('5'), ['4', '5'])
+        self.assertEqual(self._family_part_nums('single'), ['single'])
+        self.assertEqual(Part.objects.get(part_num='3').family_id, self.parts['1'].id)
+
+        self.assertEqual(update_part_families(), 0)
+
+    def test_incremental_merge(self):
+        self._relate('1', '2')
+        self._relate('4', '5')
+        update_part_families()
+
+        self._relate('2', '4')
+        self.assertEqual(update_part_families({self.parts['2'].id, self.parts['4'].id}), 2)
+
+        self.assertEqual(self._family_part_nums('5'), ['1', '2', '4', '5'])
+        self.assertEqual(self._family_part_nums('single'), ['single'])
+
+    def test_incremental_split(self):
+        self._relate('1', '2')
+        relationship = self._relate('2', '3')
+        update_part_families()
+
+        with deferred_family_updates():
+            relationship.delete()
+        update_part_families({self.parts['2'].id, self.parts['3'].id})
+
+        self.assertEqual(self._family_part_nums('1'), ['1', '2'])
+        self.assertEqual(self._family_part_nums('3'), ['3'])
+        self.assertIsNone(Part.objects.get(part_num='3').family_id)
+
+    def test_relationship_signals(self):
+        relationship = PartRelationship.objects.create(
+            parent_part=self.parts['1'], child_part=self.parts['2'], relationship_type=PartRelationship.ALTERNATE_PART)
+        self.assertEqual(self._family_part_nums('2'), ['1', '2'])
+
+        relationship.delete()
+        self.assertEqual(self._family_part_nums('2'), ['2'])
+        self.assertIsNone(Part.objects.get(part_num='1').family_id)
@@ -133,6 +133,9 @@ LOGIN_REDIRECT_URL = 'home'
 
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
+# Directory the management commands write their json run reports to, None only logs them
+IMPORT_REPORT_DIR = None
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
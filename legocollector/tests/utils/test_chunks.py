@@ -0,0 +1,9 @@
+from utils.chunks import chunks
+
+
+def test_chunks():
+    assert list(chunks(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_chunks_empty():
+    assert list(chunks([], 3)) == []
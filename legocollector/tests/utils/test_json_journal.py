@@ -0,0 +1,34 @@
+import json
+
+from utils.json_journal import JsonJournal, write_json_atomic
+
+
+def test_append_and_replay(tmp_path):
+    journal = JsonJournal(str(tmp_path / 'scrape.journal'))
+    assert not journal.exists()
+    assert not list(journal.records())
+
+    journal.append({'batch': 1})
+    journal.append({'batch': 2})
+    assert list(journal.records()) == [{'batch': 1}, {'batch': 2}]
+
+    journal.clear()
+    assert not journal.exists()
+
+
+def test_incomplete_last_line_ignored(tmp_path):
+    journal = JsonJournal(str(tmp_path / 'scrape.journal'))
+    journal.append({'batch': 1})
+    with open(journal.path, 'a', encoding='utf-8') as file_ptr:
+        file_ptr.write('{"batch": 2, "resu')
+
+    assert list(journal.records()) == [{'batch': 1}]
+
+
+def test_write_json_atomic(tmp_path):
+    json_path = tmp_path / 'scrape.json'
+    write_json_atomic(str(json_path), {'parts': {}})
+    write_json_atomic(str(json_path), {'parts': {'part1': {}}})
+
+    assert json.loads(json_path.read_text(encoding='utf-8')) == {'parts': {'part1': {}}}
+    assert [p.name for p in tmp_path.iterdir()] == ['scrape.json']
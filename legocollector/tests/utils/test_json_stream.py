@@ -0,0 +1,72 @@
+import io
+import json
+
+import pytest
+
+from utils import json_stream
+
+
+SCRAPED_DIC = {
+    'meta': {'scraped': '2020-01-01', 'counts': [1, 2, 3]},
+    'parts': {
+        'part1': {'part_img_url': 'http://image/1.png', 'external_ids': {'BrickLink': ['bl1', 'bl2']}},
+        'part2': {'part_img_url': None, 'external_ids': {}},
+        'part "3"': {'part_img_url': '', 'external_ids': {'LDraw': ['ld3']}, 'size': 123456},
+    },
+    'trailer': 1234567,
+}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64, 1024 * 1024])
+def test_iter_nested_object(chunk_size):
+    file_ptr = io.StringIO(json.dumps(SCRAPED_DIC, indent=2))
+    items = list(json_stream.iter_object_items(file_ptr, ['parts'], chunk_size=chunk_size))
+    assert items == list(SCRAPED_DIC['parts'].items())
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1024])
+def test_iter_top_level_object(chunk_size):
+    data_dic = {'3001.dat': {'top_top_studs': 8, 'bottom_studs': 0}, '3002.dat': 12345, 'x': [1.5, True, None]}
+    file_ptr = io.StringIO(json.dumps(data_dic, separators=(',', ':')))
+    assert dict(json_stream.iter_object_items(file_ptr, chunk_size=chunk_size)) == data_dic
+
+
+def test_number_cut_at_chunk_end():
+    file_ptr = io.StringIO('{"a": 123456789}')
+    assert list(json_stream.iter_object_items(file_ptr, chunk_size=9)) == [('a', 123456789)]
+
+
+def test_float_cut_at_every_chunk_boundary():
+    json_text = '{"skip": -1.5e+3, "parts": {"a": 123.45, "b": 1E-2, "c": 1}}'
+    for chunk_size in range(1, len(json_text) + 1):
+        file_ptr = io.StringIO(json_text)
+        items = list(json_stream.iter_object_items(file_ptr, ['parts'], chunk_size=chunk_size))
+        assert items == [('a', 123.45), ('b', 0.01), ('c', 1)]
+
+
+@pytest.mark.parametrize('json_text', ['{}', ' { } ', '{"parts": {}}'])
+def test_empty_object(json_text):
+    path = ['parts'] if 'parts' in json_text else []
+    assert not list(json_stream.iter_object_items(io.StringIO(json_text), path))
+
+
+def test_values_are_streamed():
+    file_ptr = io.StringIO('{"a": 1, "b": 2, "c": [}')
+    items = json_stream.iter_object_items(file_ptr, chunk_size=4)
+    assert next(items) == ('a', 1)
+    assert next(items) == ('b', 2)
+    with pytest.raises(json_stream.JsonStreamError):
+        next(items)
+
+
+INVALID_JSON = [
+    ('[1, 2]', []),
+    ('{"a": 1', []),
+    ('{"a" 1}', []),
+    ('{"a": 1}', ['parts']),
+    ('', []),
+]
+@pytest.mark.parametrize('json_text, path', INVALID_JSON)
+def test_invalid_json(json_text, path):
+    with pytest.raises(json_stream.JsonStreamError):
+        list(json_stream.iter_object_items(io.StringIO(json_text), path))
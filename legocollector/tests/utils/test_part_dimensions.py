@@ -0,0 +1,24 @@
+from decimal import Decimal
+
+from utils import part_dimensions
+
+
+def test_guess_dimension_from_name():
+    assert part_dimensions.guess_dimension_from_name('Plate 4 x 2') == (Decimal(2), Decimal(4), None)
+    assert part_dimensions.guess_dimension_from_name('Brick 1 x 2 x 3') == (Decimal(1), Decimal(2), Decimal(3))
+    assert part_dimensions.guess_dimension_from_name('Brick 12x16') == (Decimal(12), Decimal(16), None)
+    assert part_dimensions.guess_dimension_from_name('Minifig Head') is None
+
+
+def test_guess_dimensions():
+    items = [(1, 'Plate 1 x 2'), (2, 'Minifig Head'), (3, 'Brick 2 x 2 x 3')]
+    assert part_dimensions.guess_dimensions(items) == [
+        (1, (Decimal(1), Decimal(2), None)), (3, (Decimal(2), Decimal(2), Decimal(3)))]
+
+
+def test_guess_dimensions_parallel_keeps_order():
+    items = [(idx, F'Brick {idx} x 1' if idx % 3 else 'Minifig Head') for idx in range(1, 50)]
+
+    guessed = list(part_dimensions.guess_dimensions_parallel(items, workers=2, chunk_size=4))
+    assert guessed == part_dimensions.guess_dimensions(items)
+    assert [key for key, _ in guessed][:3] == [1, 2, 4]
@@ -0,0 +1,68 @@
+import pytest
+
+from utils.rate_limit import RetryPolicy, TokenBucket, backoff_delay
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_spaces_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(2, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_token_bucket_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(1, capacity=3, clock=clock, sleep=clock.sleep)
+
+    for _ in range(3):
+        assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(1.0)
+
+    # Idle time refills up to the capacity only
+    clock.now += 100
+    for _ in range(3):
+        assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('rate', [0, -1])
+def test_token_bucket_invalid_rate(rate):
+    with pytest.raises(ValueError):
+        TokenBucket(rate)
+
+
+BACKOFF_DELAYS = [
+    (0, 1),
+    (1, 2),
+    (3, 8),
+    (10, 30),
+]
+@pytest.mark.parametrize('attempt, delay', BACKOFF_DELAYS)
+def test_backoff_delay(attempt, delay):
+    assert backoff_delay(attempt, base_delay=1, max_delay=30) == delay
+
+
+def test_retry_policy():
+    clock = FakeClock()
+    retry = RetryPolicy(TokenBucket(1, clock=clock, sleep=clock.sleep), base_delay=1, max_delay=3)
+
+    assert [retry.delay(attempt) for attempt in range(1, 5)] == [1, 2, 3, 3]
+    assert retry.acquire() == 0
+    assert retry.acquire() == pytest.approx(1.0)
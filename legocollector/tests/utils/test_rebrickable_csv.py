@@ -0,0 +1,42 @@
+import io
+
+import pytest
+
+from utils import rebrickable_csv
+
+
+BOOL_VALUES = [
+    ('t', True), ('True', True), ('1', True),
+    ('f', False), ('False', False), ('0', False),
+]
+@pytest.mark.parametrize('value, expected', BOOL_VALUES)
+def test_parse_bool(value, expected):
+    assert rebrickable_csv.parse_bool(value) == expected
+
+
+def test_parse_bool_invalid():
+    with pytest.raises(ValueError):
+        rebrickable_csv.parse_bool('maybe')
+
+
+def test_parse_inventory_part_row():
+    row = {'inventory_id': '1', 'part_num': '3001', 'color_id': '4', 'quantity': '2', 'is_spare': 'f'}
+    assert rebrickable_csv.parse_inventory_part_row(row) == (1, '3001', 4, 2, False)
+
+
+def test_parse_inventory_part_row_invalid():
+    row = {'inventory_id': '1', 'part_num': '3001', 'color_id': '', 'quantity': '2', 'is_spare': 'f'}
+    assert rebrickable_csv.parse_inventory_part_row(row) is None
+
+
+def test_parse_inventory_parts_parallel_keeps_order():
+    lines = ['inventory_id,part_num,color_id,quantity,is_spare']
+    lines += [F'{idx},part{idx},1,{idx},t' for idx in range(1, 101)]
+    csv_file = io.StringIO('\n'.join(lines) + '\n')
+
+    rows = list(rebrickable_csv.parse_inventory_parts_parallel(csv_file, workers=2, chunk_rows=7))
+    assert rows == [(idx, F'part{idx}', 1, idx, True) for idx in range(1, 101)]
+
+
+def test_parse_inventory_parts_parallel_empty_file():
+    assert list(rebrickable_csv.parse_inventory_parts_parallel(io.StringIO(''), workers=2)) == []
@@ -0,0 +1,22 @@
+import pytest
+
+from utils.rebrickable_fetch import AdaptiveBatchSize
+
+
+BATCH_SIZE_UPDATES = [
+    (100, 0.5, 150),    # Fast, grow
+    (100, 1.5, 100),    # Close to the target, keep
+    (100, 3.0, 50),     # Slow, halve
+    (900, 0.1, 1000),   # Limited by the maximum
+    (15, 5.0, 10),      # Limited by the minimum
+]
+@pytest.mark.parametrize('batch_size, latency, new_size', BATCH_SIZE_UPDATES)
+def test_adaptive_batch_size(batch_size, latency, new_size):
+    sizer = AdaptiveBatchSize(batch_size, minimum=10, maximum=1000, target_latency=2.0)
+    sizer.record(batch_size, latency)
+    assert sizer.size == new_size
+
+
+def test_adaptive_batch_size_initial_limits():
+    assert AdaptiveBatchSize(5, minimum=10).size == 10
+    assert AdaptiveBatchSize(5000, maximum=1000).size == 1000
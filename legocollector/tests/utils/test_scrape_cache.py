@@ -0,0 +1,67 @@
+from utils.scrape_cache import CachePolicy, ScrapeCache
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_store_and_fresh_results(tmp_path):
+    clock = FakeClock()
+    with ScrapeCache(str(tmp_path / 'cache.sqlite3'), clock=clock) as cache:
+        changed = cache.store(['part1', 'part2'], [{'part_num': 'part1', 'name': 'Part 1'}])
+        assert changed == 1
+
+        # part2 had no result, it is still cached so it is not requested again
+        assert cache.fresh_results(['part1', 'part2', 'part3']) == {
+            'part1': {'part_num': 'part1', 'name': 'Part 1'}, 'part2': None}
+
+        clock.now += 100
+        cache.store(['part2'], [{'part_num': 'part2', 'name': 'Part 2'}])
+        assert list(cache.fresh_results(['part1', 'part2'], max_age=50)) == ['part2']
+        assert len(cache.fresh_results(['part1', 'part2'], max_age=150)) == 2
+
+
+def test_changed_count(tmp_path):
+    with ScrapeCache(str(tmp_path / 'cache.sqlite3')) as cache:
+        results = [{'part_num': 'part1', 'name': 'Part 1'}, {'part_num': 'part2', 'name': 'Part 2'}]
+        assert cache.store(['part1', 'part2'], results) == 2
+        assert cache.store(['part1', 'part2'], results) == 0
+
+        results[1] = {'part_num': 'part2', 'name': 'Renamed'}
+        assert cache.store(['part1', 'part2'], results) == 1
+
+
+def test_cache_persisted(tmp_path):
+    cache_path = str(tmp_path / 'cache.sqlite3')
+    with ScrapeCache(cache_path) as cache:
+        cache.store(['part1'], [{'part_num': 'part1'}])
+
+    with ScrapeCache(cache_path) as cache:
+        assert cache.fresh_results(['part1']) == {'part1': {'part_num': 'part1'}}
+
+
+def test_many_part_nums(tmp_path):
+    part_nums = [F'part{idx}' for idx in range(2500)]
+    with ScrapeCache(str(tmp_path / 'cache.sqlite3')) as cache:
+        cache.store(part_nums, [{'part_num': p} for p in part_nums])
+        assert len(cache.fresh_results(part_nums)) == 2500
+
+
+def test_cache_policy(tmp_path):
+    clock = FakeClock()
+    assert CachePolicy().cached_results(['part1']) == {}
+    assert CachePolicy().store(['part1'], []) is None
+
+    with ScrapeCache(str(tmp_path / 'cache.sqlite3'), clock=clock) as cache:
+        assert CachePolicy(cache).store(['part1'], [{'part_num': 'part1'}]) == 1
+        clock.now += 100
+
+        # Without max_age or offline the cache is only written
+        assert CachePolicy(cache).cached_results(['part1']) == {}
+        assert CachePolicy(cache, max_age=50).cached_results(['part1']) == {}
+        assert CachePolicy(cache, offline=True).cached_results(['part1']) == {'part1': {'part_num': 'part1'}}
@@ -0,0 +1,105 @@
+from utils.scrape_queue import ScrapeQueue
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_claim_complete(tmp_path):
+    with ScrapeQueue(str(tmp_path / 'queue.sqlite3')) as queue:
+        queue.add(['part1', 'part2', 'part3'])
+        queue.add(['part2', 'part4'])
+
+        batch_id, part_nums = queue.claim(2)
+        assert part_nums == ['part1', 'part2']
+        assert queue.status_counts() == {'in_flight': 2, 'pending': 2}
+
+        queue.complete(batch_id)
+        assert queue.claim(5)[1] == ['part3', 'part4']
+        assert queue.claim(5) == (None, [])
+        assert queue.unfinished_part_nums() == ['part3', 'part4']
+
+
+def test_fail_and_requeue(tmp_path):
+    with ScrapeQueue(str(tmp_path / 'queue.sqlite3')) as queue:
+        queue.add(['part1', 'part2'])
+        batch_id, _ = queue.claim(2)
+        queue.fail(batch_id)
+
+        assert queue.claim(2) == (None, [])
+        assert queue.requeue_failed() == 2
+        assert queue.claim(2)[1] == ['part1', 'part2']
+
+
+def test_release(tmp_path):
+    with ScrapeQueue(str(tmp_path / 'queue.sqlite3')) as queue:
+        queue.add(['part1', 'part2', 'part3'])
+        batch_id, _ = queue.claim(3)
+        queue.release(batch_id, ['part2', 'part3'])
+        queue.complete(batch_id)
+
+        assert queue.status_counts() == {'done': 1, 'pending': 2}
+        assert queue.claim(3)[1] == ['part2', 'part3']
+
+
+def test_expired_lease_reclaimed(tmp_path):
+    clock = FakeClock()
+    queue_path = str(tmp_path / 'queue.sqlite3')
+    with ScrapeQueue(queue_path, lease_seconds=60, clock=clock) as queue1, \
+            ScrapeQueue(queue_path, lease_seconds=60, clock=clock) as queue2:
+        queue1.add(['part1', 'part2'])
+        batch_id1, _ = queue1.claim(2)
+        assert queue2.claim(2) == (None, [])
+
+        # The first process died, once the lease is over the second one takes the batch over
+        clock.now += 61
+        batch_id2, part_nums = queue2.claim(2)
+        assert part_nums == ['part1', 'part2']
+
+        # A late result of the first process no longer changes the batch
+        queue1.complete(batch_id1)
+        assert queue2.status_counts() == {'in_flight': 2}
+        queue2.complete(batch_id2)
+        assert queue2.status_counts() == {'done': 2}
+
+
+def test_queue_persisted(tmp_path):
+    queue_path = str(tmp_path / 'queue.sqlite3')
+    with ScrapeQueue(queue_path) as queue:
+        queue.add(['part1', 'part2'])
+        queue.claim(1)
+
+    with ScrapeQueue(queue_path) as queue:
+        assert queue.status_counts() == {'in_flight': 1, 'pending': 1}
+
+
+def test_release_own_claims(tmp_path):
+    queue_path = str(tmp_path / 'queue.sqlite3')
+    with ScrapeQueue(queue_path, owner='worker1') as queue1, ScrapeQueue(queue_path, owner='worker2') as queue2:
+        queue1.add(['part1', 'part2', 'part3'])
+        queue1.claim(2)
+        queue2.claim(1)
+
+    # worker1 restarted, only its own claims come back before the lease expires
+    with ScrapeQueue(queue_path, owner='worker1') as queue:
+        assert queue.release_own_claims() == 2
+        assert queue.status_counts() == {'in_flight': 1, 'pending': 2}
+        assert queue.claim(5)[1] == ['part1', 'part2']
+
+
+def test_clear(tmp_path):
+    with ScrapeQueue(str(tmp_path / 'queue.sqlite3')) as queue:
+        queue.add(['part1', 'part2'])
+        queue.complete(queue.claim(2)[0])
+        queue.add(['part1', 'part2'])
+        assert queue.claim(2) == (None, [])
+
+        # A new campaign scrapes the parts again
+        queue.clear()
+        queue.add(['part1', 'part2'])
+        assert queue.claim(2)[1] == ['part1', 'part2']
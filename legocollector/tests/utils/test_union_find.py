@@ -0,0 +1,39 @@
+from utils.union_find import UnionFind
+
+
+def test_groups():
+    union_find = UnionFind()
+    union_find.union(1, 2)
+    union_find.union(3, 4)
+    union_find.union(2, 4)
+    union_find.union(5, 6)
+    union_find.find(7)
+
+    groups = sorted(sorted(group) for group in union_find.groups())
+    assert groups == [[1, 2, 3, 4], [5, 6], [7]]
+
+
+def test_find():
+    union_find = UnionFind()
+    assert union_find.find('a') == 'a'
+
+    union_find.union('a', 'b')
+    union_find.union('c', 'b')
+    assert union_find.find('a') == union_find.find('b') == union_find.find('c')
+    assert union_find.find('d') != union_find.find('a')
+
+
+def test_cycles_and_repeats():
+    union_find = UnionFind()
+    for item1, item2 in [(1, 2), (2, 3), (3, 1), (1, 2), (2, 2)]:
+        union_find.union(item1, item2)
+
+    assert [sorted(group) for group in union_find.groups()] == [[1, 2, 3]]
+
+
+def test_long_chain():
+    union_find = UnionFind()
+    for idx in range(100000):
+        union_find.union(idx, idx + 1)
+
+    assert len(union_find.groups()) == 1
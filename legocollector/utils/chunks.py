@@ -0,0 +1,9 @@
+from itertools import islice
+
+SQLITE_MAX_VARIABLES = 999  # Max bound parameters per Sqlite3 statement
+
+
+def chunks(items, size):
+    # Lists of up to size items, e.g. to keep "IN (...)" queries within SQLITE_MAX_VARIABLES
+    iterator = iter(items)
+    return iter(lambda: list(islice(iterator, size)), [])
@@ -0,0 +1,48 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class JsonJournal():
+    # Append only Json lines file, every record is synced to disk before append() returns
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def append(self, record):
+        line = json.dumps(record) + '\n'
+        with open(self.path, 'a', encoding='utf-8') as file_ptr:
+            file_ptr.write(line)
+            file_ptr.flush()
+            os.fsync(file_ptr.fileno())
+
+    def records(self):
+        if not self.exists():
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as file_ptr:
+            for line_num, line in enumerate(file_ptr, 1):
+                # A crash during append can only leave the last line incomplete
+                if not line.endswith('\n'):
+                    logger.warning(F'Ignoring incomplete journal line {line_num} in "{self.path}"')
+                    return
+                yield json.loads(line)
+
+    def clear(self):
+        if self.exists():
+            os.remove(self.path)
+
+
+def write_json_atomic(path, json_dic):
+    # Write to a temporary file first so a crash leaves either the old or the new file, never a partial one
+    temp_path = F'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file_ptr:
+        json.dump(json_dic, file_ptr)
+        file_ptr.flush()
+        os.fsync(file_ptr.fileno())
+    os.replace(temp_path, path)
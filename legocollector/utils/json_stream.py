@@ -0,0 +1,110 @@
+import json
+
+READ_CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\n\r'
+NUMBER_CHARS = '.eE+-0123456789'
+
+
+class JsonStreamError(ValueError):
+    """Invalid or unexpected Json structure."""
+
+
+class _JsonStream():
+    # Buffers enough of the file to decode one value at a time, consumed text is dropped
+
+    def __init__(self, file_ptr, chunk_size):
+        self.file_ptr = file_ptr
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+
+        chunk = self.file_ptr.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Next non whitespace character, None at the end of the file
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if (char is None) or (char not in chars):
+            raise JsonStreamError(F'Expected one of "{chars}" but found "{char}"')
+        self.pos += 1
+        return char
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                # The value may continue in the next chunk
+                if not self._fill():
+                    raise JsonStreamError(F'Invalid Json: {error}') from error
+                continue
+
+            # A number may be cut off by the end of the buffer, e.g. "12" of "123" or "123" of "123.45"
+            if self._may_continue(value, end) and self._fill():
+                continue
+
+            self.pos = end
+            return value
+
+    def _may_continue(self, value, end):
+        if end == len(self.buffer):
+            return True
+        is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+        return is_number and (self.buffer[end] in NUMBER_CHARS)
+
+    def iter_object_items(self):
+        # Called after the opening "{"
+        if self.peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            key = self.decode()
+            if not isinstance(key, str):
+                raise JsonStreamError(F'Expected an object key but found "{key}"')
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+
+def iter_object_items(file_ptr, path=(), *, chunk_size=READ_CHUNK_SIZE):
+    # Yield the (key, value) pairs of the object at path, e.g. ['parts'], one at a time.
+    # Only the current value is held in memory, values of other keys along the path are decoded and dropped.
+    stream = _JsonStream(file_ptr, chunk_size)
+    stream.expect('{')
+
+    for path_key in path:
+        for key in stream.iter_object_items():
+            if key == path_key:
+                stream.expect('{')
+                break
+            stream.decode()
+        else:
+            raise JsonStreamError(F'Key "{path_key}" not found')
+
+    for key in stream.iter_object_items():
+        yield key, stream.decode()
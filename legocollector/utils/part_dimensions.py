@@ -0,0 +1,60 @@
+import multiprocessing
+import re
+
+from collections import deque
+from decimal import Decimal
+from itertools import islice
+
+# Kept free of Django imports, worker processes may be spawned and only import this module
+
+GUESS_CHUNK_SIZE = 5000
+
+PATTERN_2 = re.compile('(?P<wh1>[0-9]{1,}) *?x *?(?P<wh2>[0-9]{1,})')
+PATTERN_3 = re.compile('(?P<wh1>[0-9]{1,}) *?x *?(?P<wh2>[0-9]{1,}) *?x *?(?P<height>[0-9]{1,})')
+
+
+def guess_dimension_from_name(name):
+    # Returns (width, length, height) from names like "Plate 2 x 4" or "Brick 1 x 2 x 3", None if no match
+    height = None
+
+    # Check if 3 Dimensions Found
+    result = PATTERN_3.search(name)
+    if result:
+        height = Decimal(result.group('height'))
+    else:
+        # Check if 2 Dimensions Found
+        result = PATTERN_2.search(name)
+
+    if not result:
+        return None
+
+    cand_w = Decimal(result.group('wh1'))
+    cand_h = Decimal(result.group('wh2'))
+    if cand_w > cand_h:
+        return (cand_h, cand_w, height)
+    return (cand_w, cand_h, height)
+
+
+def guess_dimensions(items):
+    # items are (key, name) pairs, returns (key, dimensions) for the names with a match
+    guessed = []
+    for key, name in items:
+        dims = guess_dimension_from_name(name)
+        if dims:
+            guessed.append((key, dims))
+    return guessed
+
+
+def guess_dimensions_parallel(items, *, workers, chunk_size=GUESS_CHUNK_SIZE):
+    # Worker processes guess chunks of (key, name) pairs, results are yielded in input order
+    iterator = iter(items)
+    with multiprocessing.Pool(workers) as pool:
+        # Limit the chunks in flight so memory stays bounded if the consumer is slower
+        pending = deque()
+        for chunk in iter(lambda: list(islice(iterator, chunk_size)), []):
+            pending.append(pool.apply_async(guess_dimensions, (chunk,)))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().get()
+
+        while pending:
+            yield from pending.popleft().get()
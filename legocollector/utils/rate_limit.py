@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+class TokenBucket():
+    # Thread safe rate limiter, allows "rate" acquires per second with bursts of up to "capacity"
+
+    def __init__(self, rate, *, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError(F'Rate must be positive, got {rate}')
+
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._last_refill = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        # Block until a token is available, returns the time spent waiting
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait_time = (1 - self._tokens) / self.rate
+
+            self._sleep(wait_time)
+            waited += wait_time
+
+
+class RetryPolicy():
+    # Rate limit shared by all workers and the exponential backoff between the retries of one request
+
+    def __init__(self, rate_limiter, *, max_retries=5, base_delay=2.0, max_delay=60.0):
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def acquire(self):
+        return self.rate_limiter.acquire()
+
+    def delay(self, retry):
+        # retry 1 is the first retry
+        return backoff_delay(retry - 1, base_delay=self.base_delay, max_delay=self.max_delay)
+
+
+def backoff_delay(attempt, *, base_delay, max_delay):
+    # Exponential backoff, attempt 0 is the first retry
+    return min(max_delay, base_delay * (2 ** attempt))
@@ -0,0 +1,53 @@
+import csv
+import multiprocessing
+
+from collections import deque
+from itertools import islice
+
+# Kept free of Django imports, worker processes may be spawned and only import this module
+
+PIPELINE_CHUNK_ROWS = 20000
+
+TRUE_VALUES = ('t', 'True', 'true', '1')
+FALSE_VALUES = ('f', 'False', 'false', '0')
+
+
+def parse_bool(value):
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(F'Invalid boolean value "{value}"')
+
+
+def parse_inventory_part_row(row):
+    # Returns (set_inventory, part_num, color_id, qty, is_spare) or None for an invalid row
+    try:
+        return (int(row['inventory_id']), row['part_num'], int(row['color_id']),
+                int(row['quantity']), parse_bool(row['is_spare']))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def parse_inventory_part_lines(fieldnames, lines):
+    return [parse_inventory_part_row(row) for row in csv.DictReader(lines, fieldnames=fieldnames)]
+
+
+def parse_inventory_parts_parallel(csv_file, *, workers, chunk_rows=PIPELINE_CHUNK_ROWS):
+    # Worker processes decode and convert chunks of lines, results are yielded in file order.
+    # Chunks are split on lines, inventory_parts.csv has no quoted multi line fields.
+    header = csv_file.readline()
+    if not header:
+        return
+    fieldnames = next(csv.reader([header]), [])
+
+    with multiprocessing.Pool(workers) as pool:
+        # Limit the chunks in flight so memory stays bounded if the consumer is slower
+        pending = deque()
+        for lines in iter(lambda: list(islice(csv_file, chunk_rows)), []):
+            pending.append(pool.apply_async(parse_inventory_part_lines, (fieldnames, lines)))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().get()
+
+        while pending:
+            yield from pending.popleft().get()
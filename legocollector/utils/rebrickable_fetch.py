@@ -0,0 +1,85 @@
+import http
+import io
+import json
+import threading
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+REQUEST_TIMEOUT = 60
+
+
+class FetchError(Exception):
+    """Request failed or returned an error status."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class JsonFetcher():
+    # One pooled keep-alive session shared by all worker threads, responses are gzip compressed
+
+    def __init__(self, *, pool_size=1, timeout=REQUEST_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.session.headers['Accept'] = 'application/json'
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def fetch_json(self, url):
+        # Returns (json result, latency in seconds), the body is decompressed and decoded straight from the socket
+        start_time = time.perf_counter()
+        try:
+            with self.session.get(url, timeout=self.timeout, stream=True) as resp:
+                if resp.status_code >= 400:
+                    raise FetchError(
+                        F'HTTP Error: {resp.status_code} - {_status_phrase(resp.status_code)}', resp.status_code)
+
+                resp.raw.decode_content = True
+                json_result = json.load(io.TextIOWrapper(resp.raw, encoding=resp.encoding or 'utf-8'))
+        except requests.RequestException as error:
+            raise FetchError(F'EXCEPTION: {type(error).__name__} - {error}') from error
+        except ValueError as error:
+            raise FetchError(F'Invalid Json: {error}') from error
+
+        return (json_result, time.perf_counter() - start_time)
+
+
+class AdaptiveBatchSize():
+    # Grows the batch while requests return quickly and halves it when they get slower than the target latency
+
+    def __init__(self, initial=100, *, minimum=10, maximum=1000, target_latency=2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.size = max(minimum, min(maximum, initial))
+        self._lock = threading.Lock()
+
+    def record(self, batch_size, latency):
+        with self._lock:
+            if latency > self.target_latency:
+                self.size = max(self.minimum, batch_size // 2)
+            elif latency < (self.target_latency / 2):
+                self.size = min(self.maximum, max(self.size, (batch_size * 3) // 2))
+
+
+def _status_phrase(status_code):
+    try:
+        return http.HTTPStatus(status_code).phrase
+    except ValueError:
+        return 'Unknown'
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from utils.chunks import SQLITE_MAX_VARIABLES, chunks
+
+
+class ScrapeCache():
+    # Raw scrape results keyed by part_num in a local sqlite file, with the time and content hash of the last fetch.
+    # A part_num the api returned no result for is stored with a NULL result so it is not requested again while fresh.
+
+    def __init__(self, path, *, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS scrape_cache (
+                part_num TEXT PRIMARY KEY,
+                fetched REAL NOT NULL,
+                content_hash TEXT,
+                result TEXT
+            )''')
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def store(self, part_nums, results):
+        # Returns how many of the results are new or changed since the last fetch
+        fetched = self._clock()
+        result_dic = {result['part_num']: result for result in results}
+        old_hashes = self._hashes(part_nums)
+
+        rows = []
+        changed_count = 0
+        for part_num in part_nums:
+            result = result_dic.get(part_num)
+            result_json = json.dumps(result, sort_keys=True) if result is not None else None
+            content_hash = hashlib.sha256(result_json.encode('utf-8')).hexdigest() if result_json else None
+            if (result is not None) and (old_hashes.get(part_num) != content_hash):
+                changed_count += 1
+            rows.append((part_num, fetched, content_hash, result_json))
+
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO scrape_cache (part_num, fetched, content_hash, result) VALUES (?, ?, ?, ?)',
+                rows)
+
+        return changed_count
+
+    def fresh_results(self, part_nums, *, max_age=None):
+        # {part_num: result or None} of the cached part_nums fetched within max_age seconds, any age if None
+        min_fetched = (self._clock() - max_age) if max_age is not None else None
+
+        fresh = {}
+        for chunk in chunks(part_nums, SQLITE_MAX_VARIABLES):
+            for part_num, fetched, result in self._connection.execute(
+                    F'''SELECT part_num, fetched, result FROM scrape_cache
+                        WHERE part_num IN ({', '.join('?' * len(chunk))})''', chunk):
+                if (min_fetched is None) or (fetched >= min_fetched):
+                    fresh[part_num] = json.loads(result) if result is not None else None
+        return fresh
+
+    def _hashes(self, part_nums):
+        hashes = {}
+        for chunk in chunks(part_nums, SQLITE_MAX_VARIABLES):
+            hashes.update(self._connection.execute(
+                F'''SELECT part_num, content_hash FROM scrape_cache
+                    WHERE part_num IN ({', '.join('?' * len(chunk))})''', chunk))
+        return hashes
+
+
+class CachePolicy():
+    # Which cached results are used instead of scraping, fresh ones with a max_age and all of them offline
+
+    def __init__(self, cache=None, *, max_age=None, offline=False):
+        self.cache = cache
+        self.max_age = max_age
+        self.offline = offline
+
+    def cached_results(self, part_nums):
+        # {part_num: result or None} to use instead of scraping the part_nums
+        if self.cache is None:
+            return {}
+        if self.offline:
+            return self.cache.fresh_results(part_nums)
+        if self.max_age is not None:
+            return self.cache.fresh_results(part_nums, max_age=self.max_age)
+        return {}
+
+    def store(self, part_nums, results):
+        # Returns how many results changed, None without a cache
+        if self.cache is None:
+            return None
+        return self.cache.store(part_nums, results)
@@ -0,0 +1,141 @@
+import sqlite3
+import time
+import uuid
+
+from utils.chunks import SQLITE_MAX_VARIABLES, chunks
+
+LEASE_SECONDS = 15 * 60
+LOCK_TIMEOUT = 30
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ScrapeQueue():
+    # Durable queue of part_nums in a sqlite file, several processes can claim batches from the same file.
+    # A claimed batch is leased, if its process dies the batch becomes claimable again once the lease expires.
+    # A restarted process with the same owner can release its old claims right away.
+
+    def __init__(self, path, *, owner=None, lease_seconds=LEASE_SECONDS, clock=time.time):
+        self.path = path
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self._clock = clock
+        self._connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        self._connection.execute('''
+            CREATE TABLE IF NOT EXISTS scrape_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                part_num TEXT NOT NULL UNIQUE,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                batch_id TEXT,
+                lease_expires REAL,
+                owner TEXT
+            )''')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS scrape_jobs_status ON scrape_jobs (status, id)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS scrape_jobs_batch ON scrape_jobs (batch_id)')
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, part_nums):
+        # Part_nums already queued keep their status, adding the same list again is safe
+        with self._transaction():
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO scrape_jobs (part_num, status) VALUES (?, ?)',
+                ((part_num, PENDING) for part_num in part_nums))
+
+    def clear(self):
+        # Starts a new campaign, part_nums done in the last one are scraped again once added
+        with self._transaction():
+            self._connection.execute('DELETE FROM scrape_jobs')
+
+    def release_own_claims(self):
+        # Hand back the batches a previous process with this owner still held, without waiting for the lease
+        if self.owner is None:
+            return 0
+        with self._transaction():
+            return self._connection.execute(
+                '''UPDATE scrape_jobs SET status = ?, batch_id = NULL, lease_expires = NULL, owner = NULL
+                   WHERE status = ? AND owner = ?''', (PENDING, IN_FLIGHT, self.owner)).rowcount
+
+    def requeue_failed(self):
+        with self._transaction():
+            return self._connection.execute(
+                'UPDATE scrape_jobs SET status = ?, batch_id = NULL WHERE status = ?', (PENDING, FAILED)).rowcount
+
+    def claim(self, count):
+        # Returns (batch_id, part_nums) of up to count pending or lease expired jobs, (None, []) if there are none
+        now = self._clock()
+        batch_id = uuid.uuid4().hex
+        with self._transaction():
+            job_ids = [row[0] for row in self._connection.execute(
+                '''SELECT id FROM scrape_jobs
+                   WHERE status = ? OR (status = ? AND lease_expires < ?)
+                   ORDER BY id LIMIT ?''', (PENDING, IN_FLIGHT, now, count))]
+            if not job_ids:
+                return (None, [])
+
+            for chunk in chunks(job_ids, SQLITE_MAX_VARIABLES):
+                self._connection.execute(
+                    F'''UPDATE scrape_jobs
+                        SET status = ?, batch_id = ?, lease_expires = ?, owner = ?, attempts = attempts + 1
+                        WHERE id IN ({', '.join('?' * len(chunk))})''',
+                    [IN_FLIGHT, batch_id, now + self.lease_seconds, self.owner] + chunk)
+
+        part_nums = [row[0] for row in self._connection.execute(
+            'SELECT part_num FROM scrape_jobs WHERE batch_id = ? ORDER BY id', (batch_id,))]
+        return (batch_id, part_nums)
+
+    def release(self, batch_id, part_nums):
+        # Hand back claimed part_nums that were not attempted
+        with self._transaction():
+            for chunk in chunks(part_nums, SQLITE_MAX_VARIABLES):
+                self._connection.execute(
+                    F'''UPDATE scrape_jobs SET status = ?, batch_id = NULL, attempts = attempts - 1
+                        WHERE batch_id = ? AND part_num IN ({', '.join('?' * len(chunk))})''',
+                    [PENDING, batch_id] + chunk)
+
+    def complete(self, batch_id):
+        self._set_batch_status(batch_id, DONE)
+
+    def fail(self, batch_id):
+        self._set_batch_status(batch_id, FAILED)
+
+    def status_counts(self):
+        return dict(self._connection.execute('SELECT status, COUNT(*) FROM scrape_jobs GROUP BY status'))
+
+    def unfinished_part_nums(self):
+        return [row[0] for row in self._connection.execute(
+            'SELECT part_num FROM scrape_jobs WHERE status <> ? ORDER BY id', (DONE,))]
+
+    def _set_batch_status(self, batch_id, status):
+        # Only while this process still holds the batch, an expired lease may have been claimed by another process
+        with self._transaction():
+            self._connection.execute(
+                'UPDATE scrape_jobs SET status = ?, lease_expires = NULL WHERE batch_id = ? AND status = ?',
+                (status, batch_id, IN_FLIGHT))
+
+    def _transaction(self):
+        return _Transaction(self._connection)
+
+
+class _Transaction():
+    # BEGIN IMMEDIATE takes the write lock up front so two processes cannot claim the same jobs
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
@@ -0,0 +1,43 @@
+from collections import defaultdict
+
+
+class UnionFind():
+    # Disjoint sets with path compression and union by size, items are added on first use
+
+    def __init__(self):
+        self._parents = {}
+        self._sizes = {}
+
+    def find(self, item):
+        if item not in self._parents:
+            self._parents[item] = item
+            self._sizes[item] = 1
+            return item
+
+        root = item
+        while self._parents[root] != root:
+            root = self._parents[root]
+
+        # Point everything on the path straight to the root
+        while self._parents[item] != root:
+            self._parents[item], item = root, self._parents[item]
+
+        return root
+
+    def union(self, item1, item2):
+        root1 = self.find(item1)
+        root2 = self.find(item2)
+        if root1 == root2:
+            return root1
+
+        if self._sizes[root1] < self._sizes[root2]:
+            root1, root2 = root2, root1
+        self._parents[root2] = root1
+        self._sizes[root1] += self._sizes.pop(root2)
+        return root1
+
+    def groups(self):
+        groups = defaultdict(list)
+        for item in self._parents:
+            groups[self.find(item)].append(item)
+        return list(groups.values())